@@ -0,0 +1,29 @@
+// Functions referenced from the Dash layout as {"variable": "landslides.<name>"}
+window.landslides = Object.assign({}, window.landslides, {
+    // Render tile features: clusters as orange circles sized by their count,
+    // single landslides as small blue circles. Clicking a cluster zooms in on
+    // it, the click does not reach the map so no landslide gets selected
+    pointToLayer: function (feature, latlng) {
+        const count = feature.properties.count;
+        if (count > 1) {
+            const cluster = L.circleMarker(latlng, {
+                radius: Math.min(10 + 3 * Math.log2(count), 30),
+                color: "#F28C28",
+                fillOpacity: 0.6,
+                bubblingMouseEvents: false,
+            });
+            cluster.on("click", function (e) {
+                const map = e.target._map;
+                map.setView(latlng, map.getZoom() + 2);
+            });
+            return cluster;
+        }
+        return L.circleMarker(latlng, {
+            radius: 6,
+            color: "#FFFFFF",
+            weight: 1,
+            fillColor: "#3388FF",
+            fillOpacity: 0.9,
+        });
+    },
+});
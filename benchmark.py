@@ -0,0 +1,235 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from synthetic import write_catalog
+
+# Catalog sizes benchmarked by default, larger ones can be given with --sizes
+SIZES = [10_000, 100_000, 1_000_000]
+
+# Baseline the results are compared with, written by --save
+BASELINE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json"
+)
+
+# A stage is reported as a regression when it is this much slower than the
+# baseline, stages faster than MIN_SECONDS are too noisy to be compared
+THRESHOLD = 1.25
+MIN_SECONDS = 0.001
+
+# Name the dashboard loads the catalog from
+CSV_NAME = "Global_Landslide_Catalog_Export.csv"
+
+
+# Run a stage repeat times for the wall time, then once more under tracemalloc
+# for the peak of the memory it allocates. payload turns the result of the
+# stage into the number of bytes sent to the browser
+def measure(stage, repeat, setup=None, payload=None):
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = stage()
+        times.append(time.perf_counter() - start)
+    if setup:
+        setup()
+    tracemalloc.start()
+    stage()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "seconds": min(times),
+        "median_seconds": statistics.median(times),
+        "peak_bytes": peak,
+        "payload_bytes": payload(result) if payload else None,
+    }
+
+
+# Benchmark every stage on a catalog of the given size, in the current process.
+# The dashboard loads ./data at import, so this runs in a scratch directory
+def run(rows, repeat):
+    directory = tempfile.mkdtemp(prefix="landslides-benchmark-")
+    try:
+        os.makedirs(os.path.join(directory, "data"))
+        path = os.path.join(directory, "data", CSV_NAME)
+        write_catalog(path, rows)
+        os.chdir(directory)
+        return stages(path, repeat)
+    finally:
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+# Wall time, peak memory and payload of every stage, from the CSV to the
+# figures sent to the browser
+def stages(path, repeat):
+    import plotly
+    import plotly.io
+
+    from ingest import load_catalog
+
+    results = {}
+
+    def clear_ingest_cache():
+        shutil.rmtree(os.path.join(os.path.dirname(path), ".cache"), ignore_errors=True)
+
+    results["ingest"] = measure(lambda: load_catalog(path), repeat, clear_ingest_cache)
+    results["load"] = measure(lambda: load_catalog(path), repeat)
+
+    start = time.perf_counter()
+    import main
+
+    results["startup"] = {
+        "seconds": time.perf_counter() - start,
+        "median_seconds": None,
+        "peak_bytes": None,
+        "payload_bytes": None,
+    }
+
+    data = main.data
+    catalog, cube = data.catalog, data.cube
+    key = ("landslide", catalog.min_year, catalog.max_year, (), ())
+    previous_key = ("landslide", catalog.min_year, catalog.max_year - 1, (), ())
+    previous_rows = catalog.select(*previous_key)
+    previous_aggregates = cube.aggregate(*previous_key)
+    stored_key = list(key)
+
+    def clear_caches():
+        for cache in data.caches.values():
+            cache.clear()
+
+    def to_json(value):
+        return len(json.dumps(value, cls=plotly.utils.PlotlyJSONEncoder))
+
+    results["filter"] = measure(lambda: catalog.select(*key), repeat)
+    results["filter_delta"] = measure(
+        lambda: catalog.update(previous_key, previous_rows, key), repeat
+    )
+    results["aggregate"] = measure(lambda: cube.aggregate(*key), repeat)
+    results["aggregate_delta"] = measure(
+        lambda: cube.update(previous_key, previous_aggregates, key), repeat
+    )
+    results["update_figure"] = measure(
+        lambda: main.update_figure([key[1], key[2]], [], None, key[0], None),
+        repeat,
+        clear_caches,
+        to_json,
+    )
+    results["update_markers"] = measure(
+        lambda: main.update_markers(stored_key, [[-90, -180], [90, 180]], 2, None),
+        repeat,
+        clear_caches,
+        to_json,
+    )
+
+    def tiles():
+        clusters = main.filter_clusters(data, key)
+        return [
+            main.encode_tile(catalog, clusters, 2, x, y)[1]
+            for x in range(4)
+            for y in range(4)
+        ]
+
+    results["tiles"] = measure(
+        tiles, repeat, clear_caches, lambda bodies: sum(len(b) for b in bodies)
+    )
+    for name, callback, args in [
+        ("update_bar_chart", main.update_bar_chart, [stored_key, "year", None]),
+        ("update_bar_chart_month", main.update_bar_chart, [stored_key, "month", None]),
+        (
+            "update_bar_chart_season",
+            main.update_bar_chart,
+            [stored_key, "season", None],
+        ),
+        ("update_pie_chart", main.update_pie_chart, [stored_key, None]),
+        ("update_new_pie_chart", main.update_new_pie_chart, [stored_key, None]),
+    ]:
+        results[name] = measure(
+            lambda: callback(*args),
+            repeat,
+            clear_caches,
+            lambda figure: len(plotly.io.to_json(figure)),
+        )
+    return results
+
+
+# Run one catalog size in a fresh interpreter, so every size starts from an
+# empty process and imports the dashboard on its own data
+def run_size(rows, repeat):
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", str(rows), "--repeat", str(repeat)],
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+# Print the results next to the baseline, returns the regressed stages
+def report(results, baseline):
+    regressions = []
+    header = f"{'stage':24}{'seconds':>12}{'peak MB':>10}{'payload KB':>12}"
+    for rows, timings in results.items():
+        print(f"\n{int(rows):,} rows")
+        print(f"{header}{'vs base':>10}")
+        for stage, result in timings.items():
+            peak = result["peak_bytes"]
+            payload = result["payload_bytes"]
+            ratio = ""
+            base = baseline.get(rows, {}).get(stage)
+            if base and base["seconds"]:
+                change = result["seconds"] / base["seconds"]
+                ratio = f"{change:.2f}x"
+                if change > THRESHOLD and result["seconds"] > MIN_SECONDS:
+                    ratio += " !"
+                    regressions.append((rows, stage, change))
+            print(
+                f"{stage:24}{result['seconds']:>12.4f}"
+                f"{'' if peak is None else f'{peak / 2**20:.1f}':>10}"
+                f"{'' if payload is None else f'{payload / 2**10:.1f}':>12}"
+                f"{ratio:>10}"
+            )
+    return regressions
+
+
+# python3 benchmark.py [--sizes 10000,100000] [--repeat 3] [--save]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard")
+    parser.add_argument(
+        "--sizes",
+        default=",".join(str(size) for size in SIZES),
+        help="comma-separated catalog sizes, in rows",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument(
+        "--save", action="store_true", help="store the results as the new baseline"
+    )
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run(args.child, args.repeat)))
+        sys.exit(0)
+
+    results = {}
+    for rows in args.sizes.split(","):
+        results[str(int(rows))] = run_size(int(rows), args.repeat)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = report(results, baseline)
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=1)
+    sys.exit(1 if regressions and not args.save else 0)
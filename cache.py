@@ -0,0 +1,87 @@
+import threading
+from collections import OrderedDict
+
+
+# Bounded, thread-safe least-recently-used cache with hit/miss/eviction counters
+class LRUCache:
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._generation = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._store(key, value)
+
+    def _store(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    # Return the cached value, computing and storing it on a miss. The
+    # computation runs outside the lock so slow misses do not block hits. A
+    # value computed while the cache was cleared is returned but not stored
+    def get_or_compute(self, key, compute):
+        missing = object()
+        generation = self._generation
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            with self._lock:
+                if generation == self._generation:
+                    self._store(key, value)
+        return value
+
+    # New cache with the entries for which predicate(key, value) is false, in
+    # the same order, and the counters of this one. The dropped entries are
+    # counted as invalidations
+    def copy(self, predicate):
+        cache = LRUCache(self.maxsize)
+        with self._lock:
+            for key, value in self._data.items():
+                if not predicate(key, value):
+                    cache._data[key] = value
+            cache.hits = self.hits
+            cache.misses = self.misses
+            cache.evictions = self.evictions
+            dropped = len(self._data) - len(cache._data)
+            cache.invalidations = self.invalidations + dropped
+        return cache
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
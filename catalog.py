@@ -0,0 +1,449 @@
+import functools
+
+import numpy as np
+import pandas as pd
+
+# Columns of the NASA export used by the dashboard
+COLUMNS = [
+    "source_name",
+    "source_link",
+    "event_id",
+    "event_date",
+    "event_description",
+    "event_title",
+    "landslide_category",
+    "landslide_trigger",
+    "landslide_size",
+    "fatality_count",
+    "injury_count",
+    "photo_link",
+    "latitude",
+    "longitude",
+    "country_name",
+]
+
+# Columns stored as integer codes, -1 is used for missing values
+CATEGORICAL_COLUMNS = [
+    "landslide_category",
+    "landslide_trigger",
+    "landslide_size",
+    "country_name",
+]
+
+# Missing counts are reported as zero everywhere, the ingest stores them as zero
+COUNT_COLUMNS = ["fatality_count", "injury_count"]
+
+# Free-text columns, stored as UTF-8 buffers instead of Python objects
+TEXT_COLUMNS = [
+    "source_name",
+    "source_link",
+    "event_description",
+    "event_title",
+    "photo_link",
+]
+
+
+# String column backed by one UTF-8 byte buffer and an offsets array, so it can
+# be memory-mapped. Value i is data[offsets[i]:offsets[i + 1]], NaN if missing
+class StringColumn:
+    def __init__(self, offsets, data, missing):
+        self.offsets = offsets
+        self.data = data
+        self.missing = missing
+
+    @classmethod
+    def from_values(cls, values):
+        missing = np.asarray(pd.isna(values), dtype=bool)
+        encoded = [
+            b"" if m else str(v).encode("utf-8") for v, m in zip(values, missing)
+        ]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(offsets, data, missing)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if self.missing[i]:
+            return np.nan
+        return self.data[self.offsets[i] : self.offsets[i + 1]].tobytes().decode()
+
+
+# Sorted offset index: rows with key k are order[offsets[k]:offsets[k + 1]]
+def build_offset_index(keys, size):
+    order = np.argsort(keys, kind="stable")
+    offsets = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=size), out=offsets[1:])
+    return order, offsets
+
+
+# Normalized, hashable filter: (category, start year, end year, triggers, sizes)
+# Triggers and sizes may be None, a single value or a list of values
+def filter_key(category, dates, triggers=None, sizes=None):
+    if isinstance(triggers, str):
+        triggers = [triggers]
+    if isinstance(sizes, str):
+        sizes = [sizes]
+    return (
+        category,
+        int(dates[0]),
+        int(dates[1]),
+        tuple(sorted(triggers or [])),
+        tuple(sorted(sizes or [])),
+    )
+
+
+# Chart statistics of a selection: per-year event counts, injury and
+# fatality sums, and per-code trigger and country counts (missing first)
+class Aggregates:
+    def __init__(self, years, year_counts, injuries, fatalities, triggers, countries):
+        self.years = years
+        self.year_counts = year_counts
+        self.injuries = injuries
+        self.fatalities = fatalities
+        self.trigger_counts = triggers
+        self.country_counts = countries
+
+    def __len__(self):
+        return int(self.year_counts.sum())
+
+    def __add__(self, other):
+        return Aggregates(
+            self.years,
+            self.year_counts + other.year_counts,
+            self.injuries + other.injuries,
+            self.fatalities + other.fatalities,
+            self.trigger_counts + other.trigger_counts,
+            self.country_counts + other.country_counts,
+        )
+
+    def __sub__(self, other):
+        return Aggregates(
+            self.years,
+            self.year_counts - other.year_counts,
+            self.injuries - other.injuries,
+            self.fatalities - other.fatalities,
+            self.trigger_counts - other.trigger_counts,
+            self.country_counts - other.country_counts,
+        )
+
+
+# Columnar landslide store, one copy of the catalog plus integer indexes.
+# Typed columns live in df, free-text columns in StringColumns; both may be
+# memory-mapped from the ingest cache, whose origin (see ingest.read_cache)
+# is kept to recognize a later version of the same catalog
+class LandslideCatalog:
+    def __init__(self, df, text=None, origin=None):
+        self.origin = origin or {}
+        self._labels = {}
+        if text is None:
+            text = {
+                column: StringColumn.from_values(df[column]) for column in TEXT_COLUMNS
+            }
+        self.text = text
+
+        # The frame of read_cache is used as it is, its columns stay
+        # memory-mapped. Other frames are copied once, with counts filled and
+        # categorical columns encoded. Columns are never assigned afterwards,
+        # which would copy them
+        if set(df.columns) == set(COLUMNS) - set(TEXT_COLUMNS) and all(
+            isinstance(df[column].dtype, pd.CategoricalDtype)
+            for column in CATEGORICAL_COLUMNS
+        ):
+            self.df = df
+        else:
+            columns = {}
+            for column in COLUMNS:
+                if column in CATEGORICAL_COLUMNS:
+                    columns[column] = pd.Categorical(df[column])
+                elif column in COUNT_COLUMNS:
+                    columns[column] = df[column].fillna(0).to_numpy()
+                elif column not in TEXT_COLUMNS:
+                    columns[column] = df[column].to_numpy()
+            self.df = pd.DataFrame(columns, copy=False)
+
+        # Codes and categories of the categorical columns, shared with the
+        # frame (and the cache) rather than recomputed
+        self.codes = {}
+        self.categories = {}
+        for column in CATEGORICAL_COLUMNS:
+            values = self.df[column].array
+            self.codes[column] = values.codes
+            self.categories[column] = values.categories
+
+        # Years are stored as codes relative to the first year of the catalog
+        years = self.df["event_date"].dt.year
+        self.min_year = int(years.min())
+        self.max_year = int(years.max())
+        self.codes["year"] = (
+            (years - self.min_year).fillna(-1).to_numpy().astype(np.int16)
+        )
+        self.categories["year"] = pd.Index(range(self.min_year, self.max_year + 1))
+
+        # One sorted offset index per filter dimension, missing values first
+        self.index = {}
+        for column in [
+            "landslide_category",
+            "landslide_trigger",
+            "year",
+            "landslide_size",
+        ]:
+            self.index[column] = build_offset_index(
+                self.codes[column].astype(np.int64) + 1,
+                len(self.categories[column]) + 1,
+            )
+
+        # (category, trigger, year) partitions, replacing the nested dictionary
+        self.partition_shape = (
+            len(self.categories["landslide_category"]) + 1,
+            len(self.categories["landslide_trigger"]) + 1,
+            len(self.categories["year"]) + 1,
+        )
+        partition_codes = np.ravel_multi_index(
+            (
+                self.codes["landslide_category"].astype(np.int64) + 1,
+                self.codes["landslide_trigger"].astype(np.int64) + 1,
+                self.codes["year"].astype(np.int64) + 1,
+            ),
+            self.partition_shape,
+        )
+        self.partitions = build_offset_index(
+            partition_codes, int(np.prod(self.partition_shape))
+        )
+
+        # Rows sorted by event_id, with the sorted ids for binary searches. The
+        # sort is stable, so the first row wins on duplicates
+        event_ids = self.df["event_id"].to_numpy()
+        self.event_order = np.argsort(event_ids, kind="stable")
+        self.event_ids = event_ids[self.event_order]
+
+    def __len__(self):
+        return len(self.df)
+
+    # Number of rows of a previous catalog if this catalog only appends rows to
+    # it, with the same categories, so that row indexes and codes of the
+    # previous catalog are still valid. None otherwise
+    def appended_to(self, previous):
+        base = self.origin.get("base")
+        if (
+            base is None
+            or base["sha256"] != previous.origin.get("sha256")
+            or base["rows"] != len(previous)
+        ):
+            return None
+        for column, categories in previous.categories.items():
+            if not categories.equals(self.categories[column]):
+                return None
+        return len(previous)
+
+    # Code of a value in a categorical column, -1 for missing and None if unknown
+    def code(self, column, value):
+        if value is None or value != value:
+            return -1
+        if column == "year":
+            value = int(value)
+        categories = self.categories[column]
+        if value not in categories:
+            return None
+        return int(categories.get_loc(value))
+
+    # Row-index view of all rows with the given value in an indexed column
+    def rows(self, column, value):
+        order, offsets = self.index[column]
+        code = self.code(column, value)
+        if code is None:
+            return order[:0]
+        return order[offsets[code + 1] : offsets[code + 2]]
+
+    # Boolean (trigger, year) mask of the partitions selected by a year range
+    # and trigger list, indexed by code + 1 like the partitions. An empty
+    # trigger list selects every known trigger
+    def partition_mask(self, start_year, end_year, triggers=None):
+        if triggers:
+            trigger_mask = self.lookup_table("landslide_trigger", triggers)
+        else:
+            trigger_mask = np.arange(self.partition_shape[1]) > 0
+        years = self.categories["year"].to_numpy()
+        year_mask = np.zeros(self.partition_shape[2], dtype=bool)
+        year_mask[1:] = (years >= start_year) & (years <= end_year)
+        return np.outer(trigger_mask, year_mask)
+
+    # Boolean lookup table over the codes of a column, missing values excluded
+    def lookup_table(self, column, values):
+        table = np.zeros(len(self.categories[column]) + 1, dtype=bool)
+        codes = [self.code(column, value) for value in values]
+        table[[code + 1 for code in codes if code is not None and code >= 0]] = True
+        return table
+
+    # Mask over the given rows of the ones matching a filter, as one combined
+    # vectorized expression. An empty trigger list matches every known trigger
+    # and an empty size list does not filter on size
+    def matches(self, rows, category, start_year, end_year, triggers=None, sizes=None):
+        category_code = self.code("landslide_category", category)
+        if category_code is None:
+            return np.zeros(len(rows), dtype=bool)
+        year = self.codes["year"][rows]
+        mask = (self.codes["landslide_category"][rows] == category_code) & (
+            (year >= max(start_year - self.min_year, 0))
+            & (year <= end_year - self.min_year)
+        )
+        if triggers:
+            table = self.lookup_table("landslide_trigger", triggers)
+            mask &= table[self.codes["landslide_trigger"][rows] + 1]
+        else:
+            mask &= self.codes["landslide_trigger"][rows] >= 0
+        if sizes:
+            table = self.lookup_table("landslide_size", sizes)
+            mask &= table[self.codes["landslide_size"][rows] + 1]
+        return mask
+
+    # Rows of a category matching a year range and optional trigger/size lists,
+    # masked over the category's row-index view. The result is read-only so it
+    # can be shared between sessions
+    def select(self, category, start_year, end_year, triggers=None, sizes=None):
+        rows = self.rows("landslide_category", category)
+        rows = rows[self.matches(rows, category, start_year, end_year, triggers, sizes)]
+        rows.flags.writeable = False
+        return rows
+
+    # Rows of a filter derived from the rows of a previous filter with the same
+    # category and sizes: rows of the (trigger, year) partitions that left the
+    # selection are dropped and the partitions that entered it are appended.
+    # Falls back to select when the filters are not comparable or the change
+    # is larger than the category itself
+    def update(self, previous_key, previous_rows, key):
+        category, start_year, end_year, triggers, sizes = key
+        category_code = self.code("landslide_category", category)
+        if (
+            category_code is None
+            or category_code < 0
+            or previous_key[0] != category
+            or previous_key[4] != sizes
+        ):
+            return self.select(*key)
+        old = self.partition_mask(*previous_key[1:4])
+        new = self.partition_mask(start_year, end_year, triggers)
+        removed = (old & ~new).any()
+        order, offsets = self.partitions
+        added = np.flatnonzero(new & ~old) + (category_code + 1) * new.size
+        work = int((offsets[added + 1] - offsets[added]).sum())
+        if removed:
+            work += len(previous_rows)
+        if work >= len(self.rows("landslide_category", category)):
+            return self.select(*key)
+
+        rows = previous_rows
+        if removed:
+            rows = rows[
+                new[
+                    self.codes["landslide_trigger"][rows] + 1,
+                    self.codes["year"][rows] + 1,
+                ]
+            ]
+        if len(added):
+            entered = np.concatenate(
+                [
+                    order[offsets[partition] : offsets[partition + 1]]
+                    for partition in added
+                ]
+            )
+            if sizes:
+                table = self.lookup_table("landslide_size", sizes)
+                entered = entered[table[self.codes["landslide_size"][entered] + 1]]
+            # Merge into the sorted rows instead of sorting everything again
+            entered = np.sort(entered)
+            rows = np.insert(rows, np.searchsorted(rows, entered), entered)
+        rows.flags.writeable = False
+        return rows
+
+    # Chart statistics of the selected rows, computed from the rows themselves.
+    # The dashboard reads them from the data cube, this is the reference the
+    # cube is checked against
+    def aggregate(self, rows):
+        year = self.codes["year"][rows].astype(np.int64)
+        n_years = len(self.categories["year"])
+        return Aggregates(
+            self.categories["year"].to_numpy(),
+            np.bincount(year, minlength=n_years),
+            np.bincount(
+                year,
+                weights=self.df["injury_count"].to_numpy()[rows],
+                minlength=n_years,
+            ),
+            np.bincount(
+                year,
+                weights=self.df["fatality_count"].to_numpy()[rows],
+                minlength=n_years,
+            ),
+            np.bincount(
+                self.codes["landslide_trigger"][rows] + 1,
+                minlength=len(self.categories["landslide_trigger"]) + 1,
+            ),
+            np.bincount(
+                self.codes["country_name"][rows] + 1,
+                minlength=len(self.categories["country_name"]) + 1,
+            ),
+        )
+
+    # Labels of the values of a column, indexed by code and formatted once
+    def labels(self, column, format):
+        key = (column, format)
+        if key not in self._labels:
+            self._labels[key] = np.array(
+                [format(value) for value in self.categories[column]], dtype=object
+            )
+        return self._labels[key]
+
+    # Top n values of a column from per-code counts, the rest summed as "Other".
+    # Only the n largest counts are selected and sorted, ties are broken by
+    # code. labels are the labels of the codes, the values by default
+    def top(self, column, counts, n=5, labels=None):
+        counts = np.asarray(counts[1:], dtype=np.int64)
+        if labels is None:
+            labels = self.categories[column]
+        n = min(n, len(counts))
+        top = np.arange(len(counts))
+        if 0 < n < len(counts):
+            # Unique keys, decreasing counts then increasing codes
+            keys = (counts.max() - counts) * len(counts) + top
+            top = np.argpartition(keys, n - 1)[:n]
+        top = top[np.lexsort((top, -counts[top]))][:n]
+        top = top[counts[top] > 0]
+        return (
+            list(labels[top]) + ["Other"],
+            list(counts[top]) + [counts.sum() - counts[top].sum()],
+        )
+
+    # All columns of a single row
+    def row(self, i):
+        row = {column: self.df[column].iat[i] for column in self.df.columns}
+        for column in TEXT_COLUMNS:
+            row[column] = self.text[column][i]
+        return row
+
+    # All columns of the row of an event, None if the event_id is unknown
+    def event(self, event_id):
+        i = np.searchsorted(self.event_ids, event_id)
+        if i == len(self.event_ids) or self.event_ids[i] != event_id:
+            return None
+        return self.row(self.event_order[i])
+
+
+# Predicates telling whether cached results of a filter key and the details of
+# an event are stale once new_catalog replaces catalog. If it only appends
+# events, only the filters matching one of them and the new event ids are
+# stale, otherwise everything is
+def stale_entries(catalog, new_catalog):
+    first_row = new_catalog.appended_to(catalog)
+    if first_row is None:
+        return (lambda key: True), (lambda event_id: True)
+    new_rows = np.arange(first_row, len(new_catalog))
+    event_ids = set(new_catalog.df["event_id"].to_numpy()[first_row:].tolist())
+
+    @functools.lru_cache(maxsize=None)
+    def stale_key(key):
+        return bool(new_catalog.matches(new_rows, *key).any())
+
+    return stale_key, event_ids.__contains__
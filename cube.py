@@ -0,0 +1,196 @@
+import numpy as np
+
+from catalog import Aggregates
+
+# Dimensions of the cube, every axis has a leading slot for missing values
+DIMENSIONS = ["landslide_category", "landslide_trigger", "landslide_size", "year"]
+
+# Events are added to the cube this many at a time
+BLOCK_SIZE = 1 << 20
+
+
+# Event counts, fatality sums and injury sums over category x trigger x size x
+# year, plus a sparse country breakdown of the same cells. Chart statistics
+# of any filter are answered by slicing the cube instead of scanning events
+class DataCube:
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.shape = tuple(len(catalog.categories[d]) + 1 for d in DIMENSIONS)
+        size = int(np.prod(self.shape))
+        n_countries = len(catalog.categories["country_name"]) + 1
+        fatality_count = catalog.df["fatality_count"].to_numpy()
+        injury_count = catalog.df["injury_count"].to_numpy()
+        self.counts = np.zeros(size, dtype=np.int64)
+        self.fatalities = np.zeros(size)
+        self.injuries = np.zeros(size)
+
+        # Events are accumulated in blocks, so building the cube of a large
+        # catalog never holds more than a block of cell indices
+        entries = np.empty(0, dtype=np.int64)
+        country_counts = np.empty(0, dtype=np.int64)
+        for start in range(0, len(catalog), BLOCK_SIZE):
+            block = slice(start, start + BLOCK_SIZE)
+            cells = np.ravel_multi_index(
+                tuple(catalog.codes[d][block].astype(np.int64) + 1 for d in DIMENSIONS),
+                self.shape,
+            )
+            self.counts += np.bincount(cells, minlength=size)
+            self.fatalities += np.bincount(
+                cells, weights=fatality_count[block], minlength=size
+            )
+            self.injuries += np.bincount(
+                cells, weights=injury_count[block], minlength=size
+            )
+
+            # Sparse (cell, country) entries, only combinations that occur are
+            # kept. The entries of the block are merged with the previous ones
+            block_entries, block_counts = np.unique(
+                cells * n_countries + catalog.codes["country_name"][block] + 1,
+                return_counts=True,
+            )
+            entries, inverse = np.unique(
+                np.concatenate([entries, block_entries]), return_inverse=True
+            )
+            country_counts = np.bincount(
+                inverse,
+                weights=np.concatenate([country_counts, block_counts]),
+                minlength=len(entries),
+            ).astype(np.int64)
+        self.counts = self.counts.reshape(self.shape)
+        self.fatalities = self.fatalities.reshape(self.shape)
+        self.injuries = self.injuries.reshape(self.shape)
+        self.country_counts = country_counts
+        self.country_cells, self.countries = np.divmod(entries, n_countries)
+        # Entries are sorted by cell, those of cell c are in
+        # country_offsets[c]:country_offsets[c + 1]
+        self.country_offsets = np.searchsorted(self.country_cells, np.arange(size + 1))
+
+    # Boolean mask over an axis selecting the given values, or every value
+    # (missing included unless exclude_missing) if no values are given
+    def axis_mask(self, dimension, values, exclude_missing=False):
+        if values:
+            return self.catalog.lookup_table(dimension, values)
+        mask = np.ones(self.shape[DIMENSIONS.index(dimension)], dtype=bool)
+        mask[0] = not exclude_missing
+        return mask
+
+    # Chart statistics of a filter, same result as aggregating the selected rows.
+    # As in LandslideCatalog.select, an empty trigger list selects every known
+    # trigger and an empty size list does not filter on size
+    def aggregate(self, category, start_year, end_year, triggers=None, sizes=None):
+        catalog = self.catalog
+        n_years = self.shape[3] - 1
+        category_code = catalog.code("landslide_category", category)
+        trigger_mask = self.axis_mask("landslide_trigger", triggers, True)
+        size_mask = self.axis_mask("landslide_size", sizes)
+        years = catalog.categories["year"].to_numpy()
+        year_mask = np.zeros(self.shape[3], dtype=bool)
+        year_mask[1:] = (years >= start_year) & (years <= end_year)
+        if category_code is None:
+            year_mask[:] = False
+            category_code = -1
+        selection = np.ix_(trigger_mask, size_mask, year_mask)
+
+        counts = self.counts[category_code + 1][selection]
+        year_counts = np.zeros(n_years, dtype=np.int64)
+        year_counts[year_mask[1:]] = counts.sum(axis=(0, 1))
+        injuries = np.zeros(n_years)
+        injuries[year_mask[1:]] = self.injuries[category_code + 1][selection].sum(
+            axis=(0, 1)
+        )
+        fatalities = np.zeros(n_years)
+        fatalities[year_mask[1:]] = self.fatalities[category_code + 1][selection].sum(
+            axis=(0, 1)
+        )
+        trigger_counts = np.zeros(self.shape[1], dtype=np.int64)
+        trigger_counts[trigger_mask] = counts.sum(axis=(1, 2))
+
+        # Country counts from the sparse entries of the selected cells
+        cell_mask = np.zeros(self.shape, dtype=bool)
+        cell_mask[category_code + 1][selection] = True
+        selected = cell_mask.ravel()[self.country_cells]
+        country_counts = np.bincount(
+            self.countries[selected],
+            weights=self.country_counts[selected],
+            minlength=len(catalog.categories["country_name"]) + 1,
+        ).astype(np.int64)
+
+        return Aggregates(
+            years,
+            year_counts,
+            injuries,
+            fatalities,
+            trigger_counts,
+            country_counts,
+        )
+
+    # Flat indices of the cells of a category over selected (trigger, year)
+    # partitions and sizes
+    def cells(self, category_code, partitions, size_mask):
+        triggers, years = np.nonzero(partitions)
+        sizes = np.flatnonzero(size_mask)
+        return np.ravel_multi_index(
+            (
+                np.full(len(triggers) * len(sizes), category_code + 1),
+                np.repeat(triggers, len(sizes)),
+                np.tile(sizes, len(triggers)),
+                np.repeat(years, len(sizes)),
+            ),
+            self.shape,
+        )
+
+    # Chart statistics of a set of cells, with missing years left out
+    def aggregate_cells(self, cells):
+        _, triggers, _, years = np.unravel_index(cells, self.shape)
+        counts = self.counts.ravel()[cells]
+        starts = self.country_offsets[cells]
+        lengths = self.country_offsets[cells + 1] - starts
+        entries = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        entries += np.arange(len(entries))
+        return Aggregates(
+            self.catalog.categories["year"].to_numpy(),
+            np.bincount(years, weights=counts, minlength=self.shape[3])[1:].astype(
+                np.int64
+            ),
+            np.bincount(
+                years, weights=self.injuries.ravel()[cells], minlength=self.shape[3]
+            )[1:],
+            np.bincount(
+                years, weights=self.fatalities.ravel()[cells], minlength=self.shape[3]
+            )[1:],
+            np.bincount(triggers, weights=counts, minlength=self.shape[1]).astype(
+                np.int64
+            ),
+            np.bincount(
+                self.countries[entries],
+                weights=self.country_counts[entries],
+                minlength=len(self.catalog.categories["country_name"]) + 1,
+            ).astype(np.int64),
+        )
+
+    # Chart statistics of a filter derived from those of a previous filter with
+    # the same category and sizes, by adding the cells of the (trigger, year)
+    # partitions that entered the selection and subtracting those that left
+    # it. Falls back to aggregate when the filters are not comparable or when
+    # more partitions changed than are selected
+    def update(self, previous_key, previous, key):
+        catalog = self.catalog
+        category, start_year, end_year, triggers, sizes = key
+        category_code = catalog.code("landslide_category", category)
+        if (
+            category_code is None
+            or previous_key[0] != category
+            or previous_key[4] != sizes
+        ):
+            return self.aggregate(*key)
+        old = catalog.partition_mask(*previous_key[1:4])
+        new = catalog.partition_mask(start_year, end_year, triggers)
+        entered, left = new & ~old, old & ~new
+        if entered.sum() + left.sum() >= new.sum():
+            return self.aggregate(*key)
+        size_mask = self.axis_mask("landslide_size", sizes)
+        return (
+            previous
+            + self.aggregate_cells(self.cells(category_code, entered, size_mask))
+            - self.aggregate_cells(self.cells(category_code, left, size_mask))
+        )
@@ -0,0 +1,48 @@
+import gc
+import multiprocessing
+import os
+import signal
+
+# Production server, run from the repository root with
+# gunicorn
+# Worker and thread counts can be set with the WORKERS and THREADS variables
+
+wsgi_app = "main:server"
+bind = os.environ.get("BIND", "0.0.0.0:8050")
+
+# Load the catalog, its indexes, the data cube and the spatial index once in
+# the master process. Workers are forked afterwards and share these arrays
+# copy-on-write, and the memory-mapped ingest cache through the page cache,
+# so memory stays flat as workers are added
+preload_app = True
+
+workers = int(os.environ.get("WORKERS", multiprocessing.cpu_count()))
+threads = int(os.environ.get("THREADS", 4))
+worker_class = "gthread"
+timeout = 120
+
+
+# Move the objects of the master to the permanent generation before forking,
+# so the garbage collector of the workers does not touch (and copy) their pages
+def pre_fork(server, worker):
+    gc.freeze()
+
+
+# Hot reload (RELOAD_SECONDS): the CSV is watched by the master only. It loads
+# the new data once and then replaces the workers, as on a HUP signal, with
+# workers forked from it, so they keep sharing its memory instead of each
+# building its own indexes. The cost: the caches of the new workers start
+# empty, and until the old workers have finished their requests both versions
+# of the indexes are in memory
+def when_ready(server):
+    import main
+
+    if not main.RELOAD_SECONDS:
+        return
+
+    def reload():
+        main.reload_data()
+        os.kill(server.pid, signal.SIGHUP)
+
+    main.watcher.on_change = reload
+    main.watcher.start()
@@ -0,0 +1,362 @@
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:  # Windows, where the dashboard runs in a single process
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+from catalog import (
+    CATEGORICAL_COLUMNS,
+    COLUMNS,
+    COUNT_COLUMNS,
+    TEXT_COLUMNS,
+    LandslideCatalog,
+    StringColumn,
+)
+
+# Bump when the layout of the cache changes, older caches are then rebuilt
+CACHE_VERSION = 2
+
+# Storage type of every non-categorical, non-text column
+DTYPES = {
+    "event_id": "int64",
+    "fatality_count": "float32",
+    "injury_count": "float32",
+    "latitude": "float32",
+    "longitude": "float32",
+}
+
+
+# SHA-256 of the source file, or of its first size bytes, read in blocks
+def file_hash(path, size=None):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        remaining = size
+        while remaining is None or remaining > 0:
+            block = f.read(1 << 20 if remaining is None else min(1 << 20, remaining))
+            if not block:
+                break
+            digest.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return digest.hexdigest()
+
+
+# Timestamp format of the NASA export, e.g. 08/01/2008 12:00:00 AM
+DATE_FORMAT = "%m/%d/%Y %I:%M:%S %p"
+
+# Rows read from the CSV at a time, bounds the memory used by the ingest
+CHUNKSIZE = 500_000
+
+
+# Read the used columns of the export in chunks of chunksize rows, with dates
+# parsed and numeric columns typed. Dates in another format are left as text
+# by read_csv and parsed afterwards. A non-zero offset reads only the rows
+# after the first offset bytes, i.e. the rows appended since then
+def read_chunks(path, chunksize=CHUNKSIZE, offset=0):
+    names = list(pd.read_csv(path, nrows=0).columns)
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for chunk in pd.read_csv(
+            f,
+            header=None,
+            names=names,
+            skiprows=0 if offset else 1,
+            usecols=COLUMNS,
+            parse_dates=["event_date"],
+            date_format=DATE_FORMAT,
+            dtype={column: "object" for column in CATEGORICAL_COLUMNS + TEXT_COLUMNS},
+            chunksize=chunksize,
+        ):
+            if not pd.api.types.is_datetime64_dtype(chunk["event_date"]):
+                chunk["event_date"] = pd.to_datetime(chunk["event_date"])
+            yield chunk
+
+
+# Column of the cache written chunk by chunk to a raw file, then converted to
+# a .npy file block by block, so neither step holds the whole column
+class ColumnWriter:
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.length = 0
+        self.file = open(path + ".raw", "wb")
+
+    # Append values, which may be a whole memory-mapped column: they are
+    # copied block by block
+    def append(self, values):
+        values = np.asarray(values)
+        for start in range(0, len(values), CHUNKSIZE):
+            block = np.ascontiguousarray(
+                values[start : start + CHUNKSIZE], dtype=self.dtype
+            )
+            self.file.write(block.tobytes())
+        self.length += len(values)
+
+    # Write the .npy file, optionally mapping every block to another dtype
+    def finish(self, transform=None, dtype=None):
+        self.file.close()
+        dtype = self.dtype if dtype is None else dtype
+        if self.length == 0:
+            np.save(self.path, np.empty(0, dtype=dtype))
+        else:
+            raw = np.memmap(self.path + ".raw", dtype=self.dtype, mode="r")
+            out = np.lib.format.open_memmap(
+                self.path, mode="w+", dtype=dtype, shape=(self.length,)
+            )
+            for start in range(0, self.length, CHUNKSIZE):
+                block = raw[start : start + CHUNKSIZE]
+                out[start : start + CHUNKSIZE] = (
+                    transform(block) if transform else block
+                )
+            out.flush()
+            del raw, out
+        os.remove(self.path + ".raw")
+
+
+# Text column written as the offsets, data and missing arrays of a StringColumn
+class TextWriter:
+    def __init__(self, path):
+        self.offsets = ColumnWriter(path + ".offsets.npy", np.int64)
+        self.data = ColumnWriter(path + ".data.npy", np.uint8)
+        self.missing = ColumnWriter(path + ".missing.npy", bool)
+        self.offsets.append([0])
+
+    def append(self, values):
+        self.append_column(StringColumn.from_values(values))
+
+    # Append a StringColumn, which may be memory-mapped
+    def append_column(self, text):
+        for start in range(1, len(text.offsets), CHUNKSIZE):
+            self.offsets.append(
+                text.offsets[start : start + CHUNKSIZE] + self.data.length
+            )
+        self.data.append(text.data)
+        self.missing.append(text.missing)
+
+    def finish(self):
+        for writer in [self.offsets, self.data, self.missing]:
+            writer.finish()
+
+
+# Categorical column encoded chunk by chunk with codes in order of first
+# appearance, after the given categories. Categories are sorted when the
+# column is finished, as pd.Categorical would, and the codes remapped block by
+# block
+class CategoricalWriter:
+    def __init__(self, path, categories=()):
+        self.codes = ColumnWriter(path, np.int32)
+        self.ids = {value: code for code, value in enumerate(categories)}
+
+    def append(self, values):
+        codes, uniques = pd.factorize(values)
+        mapping = np.array(
+            [self.ids.setdefault(value, len(self.ids)) for value in uniques] + [-1],
+            dtype=np.int32,
+        )
+        self.codes.append(mapping[codes])
+
+    # Sorted categories of the column
+    def finish(self):
+        categories = sorted(self.ids)
+        remap = np.full(len(categories) + 1, -1, dtype=np.int64)
+        for code, value in enumerate(categories):
+            remap[self.ids[value]] = code
+        dtype = pd.Categorical.from_codes([], categories).codes.dtype
+        self.codes.finish(lambda block: remap[block], dtype)
+        return categories
+
+
+# Convert the export into typed .npy columns plus a manifest, reading the CSV
+# in chunks so the whole file is never in memory. With base, the manifest of
+# the current cache in directory, only the rows appended to the CSV since that
+# cache was written are read, the cached rows are copied over as they are
+def write_cache(path, directory, source, chunksize=CHUNKSIZE, base=None):
+    tmp = directory + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    def file(name):
+        return os.path.join(tmp, name + ".npy")
+
+    categorical = {
+        column: CategoricalWriter(
+            file(column), base["categories"][column] if base else ()
+        )
+        for column in CATEGORICAL_COLUMNS
+    }
+    # Timestamps are stored as int64 nanoseconds, NaT included
+    fixed = {"event_date": ColumnWriter(file("event_date"), np.int64)}
+    fixed.update(
+        {column: ColumnWriter(file(column), dtype) for column, dtype in DTYPES.items()}
+    )
+    text = {column: TextWriter(os.path.join(tmp, column)) for column in TEXT_COLUMNS}
+
+    rows = 0
+    offset = 0
+    if base:
+        rows = base["rows"]
+        offset = base["source"]["size"]
+        for column, writer in categorical.items():
+            writer.codes.append(load_column(directory, column))
+        for column, writer in fixed.items():
+            writer.append(load_column(directory, column))
+        for column, writer in text.items():
+            writer.append_column(load_text(directory, column))
+
+    for chunk in read_chunks(path, chunksize, offset):
+        rows += len(chunk)
+        for column, writer in categorical.items():
+            writer.append(chunk[column])
+        fixed["event_date"].append(
+            chunk["event_date"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+        )
+        for column in DTYPES:
+            values = chunk[column]
+            if column in COUNT_COLUMNS:
+                values = values.fillna(0)
+            fixed[column].append(values.to_numpy(DTYPES[column]))
+        for column, writer in text.items():
+            writer.append(chunk[column])
+
+    manifest = {"version": CACHE_VERSION, "source": source, "rows": rows}
+    if base:
+        # Lets a running dashboard tell that its rows were kept as they are
+        manifest["base"] = {"sha256": base["source"]["sha256"], "rows": base["rows"]}
+    manifest["categories"] = {
+        column: writer.finish() for column, writer in categorical.items()
+    }
+    for writer in list(fixed.values()) + list(text.values()):
+        writer.finish()
+
+    with open(os.path.join(tmp, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp, directory)
+
+
+# Memory-mapped column of a cache
+def load_column(directory, name):
+    return np.load(os.path.join(directory, name + ".npy"), mmap_mode="r")
+
+
+# Memory-mapped text column of a cache
+def load_text(directory, column):
+    return StringColumn(
+        load_column(directory, column + ".offsets"),
+        load_column(directory, column + ".data"),
+        load_column(directory, column + ".missing"),
+    )
+
+
+# Load a cache written by write_cache, every column is memory-mapped. Also
+# returns the origin of the cache: the hash of its source and, if it was
+# extended with rows appended to the source, the hash and rows of the previous
+# cache
+def read_cache(directory):
+    def load(name):
+        return load_column(directory, name)
+
+    with open(os.path.join(directory, "manifest.json")) as f:
+        manifest = json.load(f)
+
+    columns = {}
+    for column in CATEGORICAL_COLUMNS:
+        columns[column] = pd.Categorical.from_codes(
+            load(column), manifest["categories"][column]
+        )
+    columns["event_date"] = load("event_date").view("datetime64[ns]")
+    for column in DTYPES:
+        columns[column] = load(column)
+    df = pd.DataFrame(columns, copy=False)
+
+    text = {column: load_text(directory, column) for column in TEXT_COLUMNS}
+    origin = {"sha256": manifest["source"]["sha256"], "base": manifest.get("base")}
+    return df, text, origin
+
+
+# Manifest of a cache directory, None if it is missing or unreadable
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, "manifest.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# Exclusive lock on a cache directory or file, so that of several processes
+# (e.g. gunicorn workers reloading the same CSV) only one writes it
+@contextlib.contextmanager
+def cache_lock(directory):
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(directory) or ".", exist_ok=True)
+    with open(directory + ".lock", "w") as f:
+        # Released when the file is closed
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+# True if the first size bytes of a file end a line
+def ends_line(path, size):
+    with open(path, "rb") as f:
+        f.seek(size - 1)
+        return f.read(1) == b"\n"
+
+
+# Bring the cache of the CSV up to date. The hash is only recomputed when the
+# size or modification time of the CSV changed. If rows were only appended to
+# the CSV, only those rows are read
+def update_cache(path, directory, source):
+    manifest = read_manifest(directory)
+    if manifest is not None and manifest["version"] == CACHE_VERSION:
+        cached = dict(manifest["source"])
+        digest = cached.pop("sha256")
+        if cached == source:
+            return
+        if cached["size"] == source["size"] and digest == file_hash(path):
+            # Same content with a new timestamp, remember it to skip the hash
+            manifest["source"] = dict(source, sha256=digest)
+            with open(os.path.join(directory, "manifest.json"), "w") as f:
+                json.dump(manifest, f)
+            return
+        if (
+            0 < cached["size"] < source["size"]
+            and ends_line(path, cached["size"])
+            and digest == file_hash(path, cached["size"])
+        ):
+            source["sha256"] = file_hash(path)
+            write_cache(path, directory, source, base=manifest)
+            return
+
+    source["sha256"] = file_hash(path)
+    write_cache(path, directory, source)
+
+
+# Load the catalog from the typed cache next to the CSV, converting the CSV
+# first if the cache is missing or was built from a different file
+def load_catalog(path, cache_dir=None):
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(path), ".cache")
+    directory = os.path.join(cache_dir, os.path.basename(path))
+    stat = os.stat(path)
+    source = {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    manifest = read_manifest(directory)
+    if (
+        manifest is None
+        or manifest["version"] != CACHE_VERSION
+        or {key: manifest["source"][key] for key in source} != source
+    ):
+        with cache_lock(directory):
+            # Another process may have updated the cache in the meantime
+            update_cache(path, directory, source)
+    return LandslideCatalog(*read_cache(directory))
@@ -0,0 +1,75 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Raised by JobRunner.run when a newer job with the same key was started
+class Superseded(Exception):
+    pass
+
+
+# A submitted job, done is set when it finished or was superseded
+class Job:
+    def __init__(self):
+        self.superseded = False
+        self.done = threading.Event()
+        self.future = None
+
+    def supersede(self):
+        self.superseded = True
+        if self.future is not None:
+            self.future.cancel()
+        self.done.set()
+
+    def run(self, function, args):
+        try:
+            if self.superseded:
+                return None
+            return function(*args)
+        finally:
+            self.done.set()
+
+
+# Bounded thread pool running heavy callbacks off the request threads. Jobs
+# are keyed (e.g. by session and callback): starting a job supersedes the
+# running or queued job with the same key, which is cancelled if it has not
+# started yet and whose caller returns immediately with Superseded. Jobs can
+# also be held back for a coalescing window, so that of a burst of requests
+# only the last one is computed
+class JobRunner:
+    def __init__(self, max_workers=None):
+        if max_workers is None:
+            max_workers = min(4, os.cpu_count() or 1)
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="jobs")
+        self._latest = {}
+        self._lock = threading.Lock()
+
+    # Run function(*args) in the pool and wait for its result. The job is only
+    # submitted after window seconds without a newer job with the same key; the
+    # wait happens in the calling thread and does not hold a worker. A key of
+    # None never supersedes and is never superseded
+    def run(self, key, function, *args, window=0):
+        if key is None:
+            return self._executor.submit(function, *args).result()
+
+        job = Job()
+        with self._lock:
+            previous = self._latest.get(key)
+            self._latest[key] = job
+            if previous is not None:
+                previous.supersede()
+
+        try:
+            if window > 0 and job.done.wait(window):
+                raise Superseded(key)
+            with self._lock:
+                if not job.superseded:
+                    job.future = self._executor.submit(job.run, function, args)
+            job.done.wait()
+            if job.superseded:
+                raise Superseded(key)
+            return job.future.result()
+        finally:
+            with self._lock:
+                if self._latest.get(key) is job:
+                    del self._latest[key]
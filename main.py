@@ -1,15 +1,35 @@
+import calendar
+import functools
+import gzip
+import json
+import math
+import os
 import urllib.parse
+import uuid
 import dash
 import dash_bootstrap_components as dbc
 from dash import dcc
 from dash import html
 import dash_leaflet as dl
+import flask
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
-from dash.dependencies import Input, Output, State, ALL
-from dash.exceptions import PreventUpdate
-import wikipedia
+import plotly.io as pio
+from dash.dependencies import Input, Output, State
+from dash.exceptions import MissingCallbackContextException, PreventUpdate
 import plotly.graph_objects as go
+from cache import LRUCache
+from catalog import filter_key, stale_entries
+from cube import DataCube
+from ingest import load_catalog
+from jobs import JobRunner, Superseded
+from metrics import Metrics
+from spatial import ClusterIndex, SpatialIndex, visible_tiles
+from summaries import SummaryCache
+from temporal import SEASONS, TemporalIndex
+from tiles import encode_tile, tile_key, tile_token
+from watcher import FileWatcher
 
 app = dash.Dash(
     __name__,
@@ -17,46 +37,74 @@ app = dash.Dash(
     external_stylesheets=[dbc.themes.DARKLY, "assets/styles.css"],
 )
 
-df_landslide = pd.read_csv(
-    "./data/Global_Landslide_Catalog_Export.csv", parse_dates=["event_date"]
-)
+# WSGI application, used by gunicorn (see gunicorn.conf.py)
+server = app.server
+
+# Callback latency, payload and cache metrics, served at /metrics. Setting
+# PROFILE_SECONDS writes a cProfile of every slower callback to ./profiles
+metrics = Metrics(float(os.environ.get("PROFILE_SECONDS", 0)) or None)
+metrics.instrument(app)
+
+# NASA Global Landslide Catalog export
+CATALOG_PATH = "./data/Global_Landslide_Catalog_Export.csv"
+
+
+# Sizes of the caches of results shared by all sessions:
+# - filter: catalog rows of a normalized filter key
+# - aggregate: chart statistics of a filter key
+# - session_filters: last filter key of every session with its rows and chart
+#   statistics. The next filter of a session is derived from them, so moving
+#   the slider by a year or adding a trigger only touches the partitions that
+#   changed
+# - cluster: cluster hierarchy of a filter key
+# - tile: encoded GeoJSON tile of a filter key
+# - detail: pre-rendered tweet and details of an event, by event_id
+# - figure: rendered figure of a chart for a filter key, as the JSON-ready
+#   structure sent to the browser. A hit skips building and validating it
+# - top: pie chart values of a filter key, column and number of values
+CACHE_SIZES = {
+    "filter": 256,
+    "aggregate": 256,
+    "session_filters": 1024,
+    "cluster": 64,
+    "tile": 4096,
+    "detail": 1024,
+    "figure": 512,
+    "top": 1024,
+}
 
-# Preprocess dataframes
-df_landslide = df_landslide[
-    [
-        "source_name",
-        "source_link",
-        "event_id",
-        "event_date",
-        "event_description",
-        "event_title",
-        "landslide_category",
-        "landslide_trigger",
-        "landslide_size",
-        "fatality_count",
-        "injury_count",
-        "photo_link",
-        "latitude",
-        "longitude",
-        "country_name",
-    ]
-]
-landslide_categories = df_landslide["landslide_category"].unique()
-dataframes_by_category_trigger_year = {}
 
-for category in landslide_categories:
-    dataframes_by_category_trigger_year[category] = {}
-    category_df = df_landslide[df_landslide["landslide_category"] == category]
-    triggers = category_df["landslide_trigger"].unique()
+# The catalog, its indexes and the caches of results computed from them. A
+# reload builds a new Data and swaps it in with one assignment. Callbacks read
+# the current Data once and only use that one, so they never mix a catalog
+# with the indexes or cached results of another
+class Data:
+    def __init__(self, catalog):
+        self.catalog = catalog
+        # Counts and sums over category x trigger x size x year, used by the
+        # charts
+        self.cube = DataCube(catalog)
+        # Grid index over the landslide coordinates, for bounding-box and
+        # nearest queries
+        self.spatial_index = SpatialIndex(catalog)
+        # Sorted timestamps with prefix sums, for the month, week and season
+        # histograms
+        self.temporal_index = TemporalIndex(catalog)
+        self.caches = {name: LRUCache(size) for name, size in CACHE_SIZES.items()}
 
-    for trigger in triggers:
-        dataframes_by_category_trigger_year[category][trigger] = {}
-        trigger_df = category_df[category_df["landslide_trigger"] == trigger]
-        years = trigger_df["event_date"].dt.year.unique()
 
-        for year in years:
-            year_df = trigger_df[trigger_df["event_date"].dt.year == year]
-            dataframes_by_category_trigger_year[category][trigger][year] = year_df
+# Make new_data the Data of the following callbacks
+def swap_data(new_data):
+    global data
+    for name, cache in new_data.caches.items():
+        metrics.register_cache(name, cache)
+    data = new_data
+
+
+# Load the catalog from its typed, memory-mapped cache, the CSV is only parsed
+# again when it changes
+swap_data(Data(load_catalog(CATALOG_PATH)))
+df_landslide = data.catalog.df
 
 
 # Helper functions
@@ -65,6 +113,17 @@ def pretty_column_name(column_name):
     return column_name.replace("_", " ").title()
 
 
+# Dark layout shared by every chart: the default plotly template with the
+# colors of the dashboard
+landslides_template = go.layout.Template(pio.templates["plotly"])
+landslides_template.layout.update(
+    font=dict(color="#CFCFCF"),
+    plot_bgcolor="#3E3E3E",
+    paper_bgcolor="rgba(0,0,0,0)",
+)
+pio.templates["landslides"] = landslides_template
+
+
 title = html.H1(
     children="⛰️ Landslides  Explorer🔎",
     className="title",
@@ -210,13 +269,6 @@ landslide_size = dcc.Dropdown(
 )
 
 
-# Debounce interval, used to prevent the callback from being fired too often
-debounce_interval = dcc.Interval(
-    id="debounce-interval",
-    interval=500,  # in milliseconds (500 ms = 0.5 seconds)
-    n_intervals=0,
-)
-
 # Data Filters Card, contains the date picker, landslide trigger and size dropdowns
 picker = dbc.Card(
     [
@@ -232,7 +284,6 @@ picker = dbc.Card(
                 # Landslide Size
                 dbc.Row([landslide_size_label]),
                 dbc.Row([landslide_size], class_name="mb-3"),
-                debounce_interval,
             ]
         ),
     ],
@@ -240,6 +291,15 @@ picker = dbc.Card(
     className="mb-4",
 )
 
+# Periods the histogram can be drawn by
+HISTOGRAM_PERIODS = {
+    "year": "Year",
+    "month": "Month",
+    "week": "Week",
+    "month_of_year": "Month of Year",
+    "season": "Season",
+}
+
 # Plots, contains the pie charts and histogram
 plots = dbc.Col(
     [
@@ -265,6 +325,17 @@ plots = dbc.Col(
         ),
         dbc.Col(
             [
+                # Period of the histogram bars
+                dbc.RadioItems(
+                    id="histogram-period",
+                    options=[
+                        {"label": label, "value": value}
+                        for value, label in HISTOGRAM_PERIODS.items()
+                    ],
+                    value="year",
+                    inline=True,
+                    style={"background-color": "#3E3E3E", "padding-left": "10px"},
+                ),
                 # Histogram of landslide triggers by year
                 dcc.Loading(
                     id="loading-icon-histogram-1",
@@ -273,7 +344,7 @@ plots = dbc.Col(
                         dcc.Graph(id="histogram", style={"background-color": "#3E3E3E"})
                     ],
                     style={"textAlign": "center"},
-                )
+                ),
             ],
         ),
         dbc.Col(
@@ -312,17 +383,12 @@ map = html.Div(
                         dl.TileLayer(
                             url="https://tile.thunderforest.com/landscape/{z}/{x}/{y}.png?apikey=ecc291031e064ce28fe61975dd9c1631"
                         ),
-                        dl.MarkerClusterGroup(
+                        # GeoJSON tiles of the visible area, clustered on the server
+                        dl.LayerGroup(
                             html.Div(id="placeholder", hidden=True),
                             id="markers",
-                            options={"chunkedLoading": True, "chunkInterval": 200},
-                        ),
-                        html.Div(id="clicked-marker-index", hidden=True),
-                        html.Div(
-                            id="prev-marker-clicks",
-                            hidden=True,
-                            children=[0] * len(df_landslide),
                         ),
+                        html.Div(id="clicked-event-id", hidden=True),
                     ],
                     style={
                         "width": "100%",
@@ -551,7 +617,8 @@ container = dbc.Container(
                 ),
             ]
         ),
-        # Add a hidden div for intermediate value storage
+        # Store for the filter key of the current selection, the filtered
+        # rows themselves stay on the server
         dcc.Store(id="intermediate-value"),
     ],
     fluid=True,
@@ -566,111 +633,245 @@ container = dbc.Container(
     },
 )
 
-# Set the app layout
-app.layout = container
 
-# Global filtered dataframe, used to only have to filter the dataframe once
-global_filtered_df = None
+# Set the app layout, every page load gets its own session id so that
+# background jobs of a session only supersede jobs of the same session
+def serve_layout():
+    return html.Div([container, dcc.Store(id="session-id", data=uuid.uuid4().hex)])
 
 
-# Update the global_filtered_df
-def update_global_filtered_df(selected_tab, dates, selected_triggers, selected_sizes):
-    global global_filtered_df
+app.layout = serve_layout
 
-    # Get all triggers for the selected category if no triggers are selected
-    if not selected_triggers:
-        selected_triggers = list(
-            dataframes_by_category_trigger_year[selected_tab].keys()
-        )
+# Bounded pool running the heavy callbacks off the request threads
+jobs = JobRunner()
+
+
+# Seconds during which bursts of filter and map changes are coalesced, only
+# the last state of a burst is computed
+COALESCE_WINDOW = 0.15
 
-    # If selected_triggers is a string, convert it to a list
-    if isinstance(selected_triggers, str):
-        selected_triggers = [selected_triggers]
-
-    data = pd.DataFrame()
-    start_date = dates[0]
-    end_date = dates[1]
-    for trigger in selected_triggers:
-        for year, temp_df in dataframes_by_category_trigger_year[selected_tab][
-            trigger
-        ].items():
+
+# Run a callback in the job pool. The session id is the last argument of the
+# callback; a newer call of the same callback in the same session supersedes
+# a running, queued or coalescing one, which then returns without updating
+# its outputs. The coalescing window may be a function of the triggering input
+def in_background(name, window=0):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args):
+            session_id = args[-1]
+            key = None if session_id is None else (session_id, name)
             try:
-                if start_date <= year <= end_date:
-                    data = pd.concat([data, temp_df])
-            except Exception as e:
-                print(f"Error while processing trigger '{trigger}': {e}")
-
-    if selected_sizes:
-        if isinstance(selected_sizes, str):
-            selected_sizes = [selected_sizes]
-        data = data[data["landslide_size"].isin(selected_sizes)]
-
-    global_filtered_df = data
-    if global_filtered_df is not None and not global_filtered_df.empty:
-        global_filtered_df["fatality_count"] = global_filtered_df[
-            "fatality_count"
-        ].fillna(0)
-        global_filtered_df["injury_count"] = global_filtered_df["injury_count"].fillna(
-            0
+                return jobs.run(
+                    key,
+                    metrics.profile,
+                    function.__name__,
+                    function,
+                    *args,
+                    window=window() if callable(window) else window,
+                )
+            except Superseded:
+                raise PreventUpdate
+
+        wrapper.background = True
+        return wrapper
+
+    return decorator
+
+
+# Get the catalog rows of a normalized filter key
+def key_rows(state, key):
+    return state.caches["filter"].get_or_compute(
+        key, lambda: state.catalog.select(*key)
+    )
+
+
+# Normalize a filter key read back from the intermediate-value store
+def stored_filter_key(stored_key):
+    selected_tab, start_date, end_date, selected_triggers, selected_sizes = stored_key
+    return filter_key(
+        selected_tab, [start_date, end_date], selected_triggers, selected_sizes
+    )
+
+
+# Get the chart statistics for a filter key read back from the intermediate-value store
+def stored_aggregates(state, stored_key):
+    key = stored_filter_key(stored_key)
+    return state.caches["aggregate"].get_or_compute(
+        key, lambda: state.cube.aggregate(*key)
+    )
+
+
+# Compute (or find in the shared caches) the rows and chart statistics of a
+# new filter of a session, as a delta from its previous filter if it has one
+def update_session_filter(state, session_id, key):
+    session_filters = state.caches["session_filters"]
+    aggregate_cache = state.caches["aggregate"]
+    previous = None if session_id is None else session_filters.get(session_id)
+    if previous is None:
+        rows = key_rows(state, key)
+        aggregates = aggregate_cache.get_or_compute(
+            key, lambda: state.cube.aggregate(*key)
+        )
+    else:
+        previous_key, previous_rows, previous_aggregates = previous
+        rows = state.caches["filter"].get_or_compute(
+            key, lambda: state.catalog.update(previous_key, previous_rows, key)
+        )
+        aggregates = aggregate_cache.get_or_compute(
+            key, lambda: state.cube.update(previous_key, previous_aggregates, key)
         )
+    if session_id is not None:
+        session_filters.put(session_id, (key, rows, aggregates))
+    return rows
 
 
-# Update the dataframe when the datepicker or dropdowns are changed, store the result in the hidden div
+# Update the filter key when the datepicker or dropdowns are changed, store it in the hidden div
 @app.callback(
     Output("intermediate-value", "data"),
     Input("datepickerrange", "value"),
     Input("trigger-dropdown", "value"),
     Input("size-dropdown", "value"),
     Input("category-tabs", "value"),
+    State("session-id", "data"),
 )
-def update_figure(dates, selected_triggers, selected_sizes, selected_tab):
-    update_global_filtered_df(selected_tab, dates, selected_triggers, selected_sizes)
-    return global_filtered_df.to_json(date_format="iso", orient="split")
+@in_background("filter", COALESCE_WINDOW)
+def update_figure(dates, selected_triggers, selected_sizes, selected_tab, session_id):
+    key = filter_key(selected_tab, dates, selected_triggers, selected_sizes)
+    metrics.add_rows("update_figure", len(update_session_filter(data, session_id, key)))
+    return key
+
+
+# Maximum number of tile layers added to the map
+MAX_TILES = 32
+
+
+# Get the cluster hierarchy of a normalized filter key
+def filter_clusters(state, key):
+    return state.caches["cluster"].get_or_compute(
+        key,
+        lambda: ClusterIndex(
+            state.catalog.df["latitude"],
+            state.catalog.df["longitude"],
+            key_rows(state, key),
+        ),
+    )
+
 
+# GeoJSON tile of the clusters and landslides matching a filter, gzip-compressed
+# and served with an ETag so browsers and proxies can cache it
+@app.server.route("/tiles/<token>/<int:z>/<int:x>/<int:y>.geojson")
+@metrics.timed("serve_tile")
+def serve_tile(token, z, x, y):
+    try:
+        key = tile_key(token)
+    except ValueError:
+        flask.abort(404)
+    state = data
+    etag, body = state.caches["tile"].get_or_compute(
+        (key, z, x, y),
+        lambda: encode_tile(state.catalog, filter_clusters(state, key), z, x, y),
+    )
+    response = flask.Response(content_type="application/geo+json")
+    response.cache_control.public = True
+    response.cache_control.max_age = 3600
+    response.vary.add("Accept-Encoding")
+    # The two encodings are different bytes, so they get different strong ETags
+    if "gzip" in flask.request.accept_encodings:
+        response.set_data(body)
+        response.content_encoding = "gzip"
+        response.set_etag(etag + "-gz")
+    else:
+        response.set_data(gzip.decompress(body))
+        response.set_etag(etag)
+    return response.make_conditional(flask.request)
 
-# Update the map markers
+
+# Map moves are coalesced, a new filter was already coalesced by the filter
+# callback and is not delayed a second time
+def markers_window():
+    try:
+        if dash.ctx.triggered_id == "intermediate-value":
+            return 0
+    except MissingCallbackContextException:
+        # Called outside of a request, e.g. by the benchmark
+        pass
+    return COALESCE_WINDOW
+
+
+# Update the map markers, one GeoJSON layer per visible tile of the current filter
 @app.callback(
     Output("markers", "children"),
     Input("intermediate-value", "data"),
+    Input("map", "bounds"),
+    Input("map", "zoom"),
+    State("session-id", "data"),
 )
-def update_markers(jsonified_global_filtered_df):
-    global_filtered_df = pd.read_json(jsonified_global_filtered_df, orient="split")
-    markers = [
-        dl.Marker(
-            # icon = emoji_icon,
-            id={"type": "marker", "index": i},
-            position=[row["latitude"], row["longitude"]],
-            children=[
-                dl.Tooltip(row["event_title"]),
-            ],
+@in_background("markers", markers_window)
+def update_markers(stored_key, bounds, zoom, session_id):
+    token = tile_token(stored_filter_key(stored_key))
+    # Tiles are cached by browsers, their URLs change when the data is reloaded
+    version = data.catalog.origin.get("sha256", "")[:12]
+    if not bounds:
+        bounds = [[-90, -180], [90, 180]]
+    return [
+        dl.GeoJSON(
+            url=app.get_relative_path(
+                f"/tiles/{token}/{z}/{x}/{y}.geojson?v={version}"
+            ),
+            options={"pointToLayer": {"variable": "landslides.pointToLayer"}},
         )
-        for i, row in global_filtered_df.iterrows()
+        for z, x, y in visible_tiles(bounds, zoom, MAX_TILES)
     ]
-    return markers
 
 
-# Marker click callback
+# Distance in screen pixels within which a map click selects a landslide
+CLICK_TOLERANCE = 10
+
+
+# Marker click callback. Clicks on landslide markers bubble up to the map, the
+# clicked landslide is resolved with a nearest-neighbour lookup in the spatial
+# index restricted to the current filter, so the request only carries the
+# click position whatever the number of markers. Only landslides drawn as
+# single points at the zoom level of the tiles can be clicked, clicks on
+# clusters zoom in on the client and never get here, and clicks next to a
+# cluster are ignored rather than resolved to one of its landslides
 @app.callback(
-    [
-        Output("clicked-marker-index", "children"),
-        Output("prev-marker-clicks", "children"),
-    ],
-    [Input({"type": "marker", "index": ALL}, "n_clicks")],
-    [
-        State({"type": "marker", "index": ALL}, "position"),
-        State("prev-marker-clicks", "children"),
-    ],
+    Output("clicked-event-id", "children"),
+    Input("map", "click_lat_lng"),
+    State("map", "zoom"),
+    State("map", "bounds"),
+    State("intermediate-value", "data"),
 )
-def marker_click(n_clicks, positions, prev_clicks):
-    clicked_marker_idx = None
-    for i, (prev, curr) in enumerate(zip(prev_clicks, n_clicks)):
-        if prev != curr:
-            clicked_marker_idx = i
-            break
-    if clicked_marker_idx is not None:
-        # clicked_position = positions[clicked_marker_idx]
-        return clicked_marker_idx, n_clicks
-    return dash.no_update, prev_clicks
+def marker_click(click_lat_lng, zoom, bounds, stored_key):
+    if not click_lat_lng or not stored_key:
+        raise PreventUpdate
+    latitude, longitude = click_lat_lng
+    key = stored_filter_key(stored_key)
+    state = data
+    # Web Mercator ground resolution in kilometres per pixel at this zoom
+    km_per_pixel = (
+        40075.016686 * math.cos(math.radians(latitude)) / 2 ** ((zoom or 0) + 8)
+    )
+    spatial_index = state.spatial_index
+    rows, _ = spatial_index.radius(
+        latitude, longitude, CLICK_TOLERANCE * km_per_pixel, key
+    )
+    if not bounds:
+        bounds = [[-90, -180], [90, 180]]
+    z = visible_tiles(bounds, zoom, MAX_TILES)[0][0]
+    counts = filter_clusters(state, key).counts(
+        z, spatial_index.latitude[rows], spatial_index.longitude[rows]
+    )
+    rows = rows[counts == 1]
+    if not len(rows):
+        raise PreventUpdate
+    return int(state.catalog.df["event_id"].iat[rows[0]])
+
+
+# Wikipedia summaries of the categories without a hard-coded description,
+# kept on disk so tab switches never wait on the network
+summary_cache = SummaryCache("./data/.cache/wikipedia.json")
 
 
 # Add tabs details
@@ -697,34 +898,22 @@ def update_tab_details(selected_tab):
     elif selected_tab == "snow_avalanche":
         return "A snow avalanche begins when an unstable mass of snow breaks away from a slope. The snow picks up speed as it moves downhill, producing a river of snow and a cloud of icy particles that rises high into the air. The moving mass picks up even more snow as it rushes downhill."
     else:
-        return wikipedia.summary(selected_tab)
+        return summary_cache.get(
+            selected_tab,
+            f"No description available for {pretty_column_name(selected_tab)}.",
+        )
 
 
-# Add a callback to update the tweet text
-@app.callback(Output("tweet-text", "value"), Input("clicked-marker-index", "children"))
-def update_tweet_text(clicked_marker_idx):
-    if (
-        clicked_marker_idx is None
-        or global_filtered_df is None
-        or global_filtered_df.empty
-    ):
-        raise PreventUpdate
-    row = global_filtered_df.iloc[clicked_marker_idx]
+# Tweet text of a landslide
+def render_tweet(row):
     event_title = row["event_title"]
     source_name = row["source_name"]
     event_date = row["event_date"].strftime("%Y-%m-%d")
-    tweet = f"{event_title} on {event_date} by {source_name}. #landslides #InfoVis"
-    return tweet
+    return f"{event_title} on {event_date} by {source_name}. #landslides #InfoVis"
 
 
-# Callback updates the landslide description
-@app.callback(
-    Output("landslide-info", "children"), Input("clicked-marker-index", "children")
-)
-def update_landslide_details(clicked_marker_idx):
-    if clicked_marker_idx is None:
-        raise PreventUpdate
-    row = global_filtered_df.iloc[clicked_marker_idx]
+# Details panel of a landslide
+def render_details(row):
     img_link = row["photo_link"]
     if img_link != img_link:  # if img_link is NaN
         img_link = "/assets/no_image.gif"
@@ -768,6 +957,43 @@ def update_landslide_details(clicked_marker_idx):
     ]
 
 
+# Tweet and details of an event, the callbacks do not update on unknown ids.
+# They only depend on the event, not on the filters of the session
+def event_details(state, event_id):
+    def render():
+        row = state.catalog.event(event_id)
+        if row is None:
+            return None
+        return {"tweet": render_tweet(row), "details": render_details(row)}
+
+    details = state.caches["detail"].get_or_compute(event_id, render)
+    if details is None:
+        raise PreventUpdate
+    return details
+
+
+# Add a callback to update the tweet text
+@app.callback(
+    Output("tweet-text", "value"),
+    Input("clicked-event-id", "children"),
+)
+def update_tweet_text(clicked_event_id):
+    if clicked_event_id is None:
+        raise PreventUpdate
+    return event_details(data, clicked_event_id)["tweet"]
+
+
+# Callback updates the landslide description
+@app.callback(
+    Output("landslide-info", "children"),
+    Input("clicked-event-id", "children"),
+)
+def update_landslide_details(clicked_event_id):
+    if clicked_event_id is None:
+        raise PreventUpdate
+    return event_details(data, clicked_event_id)["details"]
+
+
 # Callback updates the twitter share button
 @app.callback(Output("twitter-share-button", "href"), Input("tweet-text", "value"))
 def update_twitter_share_button(tweet_text):
@@ -778,150 +1004,232 @@ def update_twitter_share_button(tweet_text):
 
 
 
-# Callback updates the histogram
-@app.callback(Output("histogram", "figure"), Input("intermediate-value", "data"))
-def update_bar_chart(jsonified_global_filtered_df):
-    global_filtered_df = pd.read_json(jsonified_global_filtered_df, orient="split")
-    filtered_df = global_filtered_df
-    if filtered_df.empty:
-        return go.Figure().update_layout(
-            title=f"No data for selected filters",
-            font=dict(color="#CFCFCF"),
-            plot_bgcolor="#3E3E3E",
-            paper_bgcolor="rgba(0,0,0,0)",
+# Histogram bars of a filter key by a period other than the year: bar labels
+# with the event counts, injury and fatality sums, from the temporal index
+def period_histogram(state, key, period):
+    category, start_year, end_year, triggers, sizes = key
+    start = pd.Timestamp(start_year, 1, 1)
+    end = pd.Timestamp(end_year + 1, 1, 1)
+    if period in ["month", "week"]:
+        labels, counts, fatalities, injuries = state.temporal_index.histogram(
+            period, category, start, end, triggers, sizes
         )
-    filtered_df["event_date"] = pd.to_datetime(filtered_df["event_date"])
-    filtered_df["year"] = filtered_df["event_date"].dt.to_period("Y")
-    yearly_counts = (
-        filtered_df.groupby("year")
-        .agg({"injury_count": "sum", "fatality_count": "sum"})
-        .reset_index()
+        # Only the months or weeks with events, like the years
+        has_data = counts > 0
+        labels = labels[has_data].strftime("%Y-%m" if period == "month" else "%Y-%m-%d")
+        return labels, counts[has_data], injuries[has_data], fatalities[has_data]
+    counts, fatalities, injuries = state.temporal_index.seasonal(
+        period, category, start, end, triggers, sizes
+    )
+    labels = SEASONS if period == "season" else list(calendar.month_abbr[1:])
+    return labels, counts, injuries, fatalities
+
+
+# Figure of a chart for a filter key read back from the intermediate-value
+# store, built by render on a miss
+def cached_figure(state, stored_key, chart, render):
+    return state.caches["figure"].get_or_compute(
+        (stored_filter_key(stored_key), chart),
+        lambda: json.loads(render().to_json()),
+    )
+
+
+# Figure shown when no landslide matches the filters
+def empty_figure():
+    return go.Figure(
+        layout=dict(title="No data for selected filters", template="landslides")
     )
+
+
+# Histogram of injuries and fatalities per period
+def render_bar_chart(state, stored_key, period):
+    if period == "year":
+        aggregates = stored_aggregates(state, stored_key)
+        has_data = aggregates.year_counts > 0
+        labels = aggregates.years[has_data].astype(str)
+        counts = aggregates.year_counts
+        injuries = aggregates.injuries[has_data]
+        fatalities = aggregates.fatalities[has_data]
+    else:
+        labels, counts, injuries, fatalities = period_histogram(
+            state, stored_filter_key(stored_key), period
+        )
+    metrics.add_rows("update_bar_chart", counts.sum())
+    if not counts.sum():
+        return empty_figure()
     fig = go.Figure()
     fig.add_trace(
         go.Bar(
-            x=yearly_counts["year"].astype(str),
-            y=yearly_counts["injury_count"],
+            x=labels,
+            y=injuries,
             name="Injury count",
         )
     )
     fig.add_trace(
         go.Bar(
-            x=yearly_counts["year"].astype(str),
-            y=yearly_counts["fatality_count"],
+            x=labels,
+            y=fatalities,
             name="Fatality count",
         )
     )
 
-    pretty = filtered_df["landslide_category"].apply(pretty_column_name).unique()
-
     fig.update_layout(
-        title=f"Injuries and Fatalities per Year for {pretty[0]}",
-        xaxis_title="Year",
+        title=f"Injuries and Fatalities per {HISTOGRAM_PERIODS[period]} for {pretty_column_name(stored_key[0])}",
+        xaxis_title=HISTOGRAM_PERIODS[period],
         yaxis_title="Number of Injuries and Fatalities",
-        font=dict(color="#CFCFCF"),
-        plot_bgcolor="#3E3E3E",
-        paper_bgcolor="rgba(0,0,0,0)",
+        template="landslides",
         barmode="group",
     )
     return fig
 
 
-# Pie chart callback
+# Callback updates the histogram
 @app.callback(
-    Output("pie-chart", "figure"),
+    Output("histogram", "figure"),
     Input("intermediate-value", "data"),
+    Input("histogram-period", "value"),
+    State("session-id", "data"),
 )
-def update_pie_chart(jsonified_global_filtered_df):
-    global_filtered_df = pd.read_json(jsonified_global_filtered_df, orient="split")
-    filtered_df = global_filtered_df
-
-    if filtered_df.empty:
-        return go.Figure().update_layout(
-            title=f"No data for selected filters",
-            font=dict(color="#CFCFCF"),
-            plot_bgcolor="#3E3E3E",
-            paper_bgcolor="rgba(0,0,0,0)",
+@in_background("histogram")
+def update_bar_chart(stored_key, period, session_id):
+    period = period or "year"
+    state = data
+    return cached_figure(
+        state,
+        stored_key,
+        ("histogram", period),
+        lambda: render_bar_chart(state, stored_key, period),
+    )
+
+
+# Number of values shown by the pie charts, the others are grouped as "Other"
+TOP_N = int(os.environ.get("TOP_N", 5))
+
+
+# Top n values of a column for a filter key read back from the
+# intermediate-value store, with their pretty labels and counts plus "Other",
+# from the cached per-code counts of the filter
+def top_values(state, stored_key, column, n=TOP_N):
+    key = stored_filter_key(stored_key)
+
+    def compute():
+        aggregates = stored_aggregates(state, stored_key)
+        counts = (
+            aggregates.trigger_counts
+            if column == "landslide_trigger"
+            else aggregates.country_counts
+        )
+        return state.catalog.top(
+            column, counts, n, state.catalog.labels(column, pretty_column_name)
         )
 
-    trigger_counts = filtered_df["landslide_trigger"].value_counts().reset_index()
-    trigger_counts.columns = ["landslide_trigger", "count"]
+    return state.caches["top"].get_or_compute((key, column, n), compute)
 
-    # Limit to top 5 triggers
-    top_triggers = trigger_counts.head(5)
-    other_count = trigger_counts.iloc[5:]["count"].sum()
 
-    # Add "Other" to the top_triggers DataFrame
-    other_row = pd.DataFrame({"landslide_trigger": ["Other"], "count": [other_count]})
-    top_triggers = pd.concat([top_triggers, other_row], ignore_index=True)
+# Pie chart of the top values of a column, the rest grouped as "Other"
+def render_pie_chart(state, stored_key, column, title, callback):
+    aggregates = stored_aggregates(state, stored_key)
+    metrics.add_rows(callback, len(aggregates))
+    if not len(aggregates):
+        return empty_figure()
 
-    top_triggers["landslide_trigger"] = top_triggers["landslide_trigger"].apply(
-        pretty_column_name
-    )
+    labels, values = top_values(state, stored_key, column)
 
     fig = go.Figure(
         go.Pie(
-            labels=top_triggers["landslide_trigger"],
-            values=top_triggers["count"],
+            labels=labels,
+            values=values,
             textinfo="label+percent",
             insidetextorientation="radial",
         )
     )
 
-    fig.update_layout(
-        title="Landslide Triggers",
-        font=dict(color="#CFCFCF"),
-        paper_bgcolor="rgba(0,0,0,0)",
-    )
+    fig.update_layout(title=title, template="landslides")
     return fig
 
 
-# Second pie chart callback
-@app.callback(Output("new_pie-chart", "figure"), Input("intermediate-value", "data"))
-def update_new_pie_chart(jsonified_global_filtered_df):
-    global_filtered_df = pd.read_json(jsonified_global_filtered_df, orient="split")
-    filtered_df = global_filtered_df
-    if filtered_df.empty:
-        return go.Figure().update_layout(
-            title=f"No data for selected filters",
-            font=dict(color="#CFCFCF"),
-            plot_bgcolor="#3E3E3E",
-            paper_bgcolor="rgba(0,0,0,0)",
-        )
-
-    country_counts = filtered_df["country_name"].value_counts().reset_index()
-    country_counts.columns = ["country_name", "count"]
-
-    # Limit to top 5 countries
-    top_countries = country_counts.head(5)
-    other_count = country_counts.iloc[5:]["count"].sum()
+# Pie chart callback
+@app.callback(
+    Output("pie-chart", "figure"),
+    Input("intermediate-value", "data"),
+    State("session-id", "data"),
+)
+@in_background("pie-chart")
+def update_pie_chart(stored_key, session_id):
+    state = data
+    return cached_figure(
+        state,
+        stored_key,
+        ("pie", "landslide_trigger"),
+        lambda: render_pie_chart(
+            state,
+            stored_key,
+            "landslide_trigger",
+            "Landslide Triggers",
+            "update_pie_chart",
+        ),
+    )
 
-    # Add "Other" to the top_countries DataFrame
-    other_row = pd.DataFrame({"country_name": ["Other"], "count": [other_count]})
-    top_countries = pd.concat([top_countries, other_row], ignore_index=True)
 
-    top_countries["country_name"] = top_countries["country_name"].apply(
-        pretty_column_name
+# Second pie chart callback
+@app.callback(
+    Output("new_pie-chart", "figure"),
+    Input("intermediate-value", "data"),
+    State("session-id", "data"),
+)
+@in_background("new_pie-chart")
+def update_new_pie_chart(stored_key, session_id):
+    state = data
+    return cached_figure(
+        state,
+        stored_key,
+        ("pie", "country_name"),
+        lambda: render_pie_chart(
+            state,
+            stored_key,
+            "country_name",
+            "Landslide Distribution by Country",
+            "update_new_pie_chart",
+        ),
     )
 
-    fig = go.Figure(
-        go.Pie(
-            labels=top_countries["country_name"],
-            values=top_countries["count"],
-            textinfo="label+percent",
-            insidetextorientation="radial",
-        )
-    )
 
-    fig.update_layout(
-        title=f"Landslide Distribution by Country",
-        font=dict(color="#CFCFCF"),
-        plot_bgcolor="#3E3E3E",
-        paper_bgcolor="rgba(0,0,0,0)",
-    )
-    return fig
+# Seconds between checks of the CSV for new data, hot reload is enabled by
+# setting RELOAD_SECONDS
+RELOAD_SECONDS = float(os.environ.get("RELOAD_SECONDS", 0))
+
+
+# Replace the data with the data of the changed CSV. It is built in the
+# watcher thread while the current data keeps serving, takes over the cache
+# entries that are still valid and is then swapped in
+def reload_data():
+    current = data
+    new_data = Data(load_catalog(CATALOG_PATH))
+    stale_key, stale_event = stale_entries(current.catalog, new_data.catalog)
+    stale = {
+        "filter": lambda key, value: stale_key(key),
+        "aggregate": lambda key, value: stale_key(key),
+        "cluster": lambda key, value: stale_key(key),
+        "top": lambda key, value: stale_key(key[0]),
+        "figure": lambda key, value: stale_key(key[0]),
+        "tile": lambda key, value: stale_key(key[0]),
+        "session_filters": lambda session_id, value: stale_key(value[0]),
+        "detail": lambda event_id, value: stale_event(event_id),
+    }
+    new_data.caches = {
+        name: cache.copy(stale[name]) for name, cache in current.caches.items()
+    }
+    swap_data(new_data)
+
+
+# Polls the CSV for changes and reloads the data. Started below for the
+# development server; under gunicorn it runs in the master process only, see
+# gunicorn.conf.py
+watcher = FileWatcher(CATALOG_PATH, RELOAD_SECONDS, reload_data)
 
 
 # Main function, runs the dashboard server
 if __name__ == "__main__":
+    if RELOAD_SECONDS:
+        watcher.start()
     app.run_server(debug=False)
@@ -0,0 +1,211 @@
+import bisect
+import cProfile
+import functools
+import os
+import threading
+import time
+
+import flask
+from dash.exceptions import PreventUpdate
+
+# Upper bounds of the duration histogram buckets, in seconds
+DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+# Upper bounds of the response size histogram buckets, in bytes
+SIZE_BUCKETS = [1 << 10, 4 << 10, 16 << 10, 64 << 10, 256 << 10, 1 << 20, 4 << 20]
+
+
+# Cumulative histogram in the Prometheus sense: bucket i counts observations
+# lower than or equal to buckets[i]
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    # Exposition lines of the histogram with the given labels
+    def lines(self, name, labels):
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets + ["+Inf"], self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {total}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+# Per-callback durations, outcomes, processed rows and response sizes, plus
+# the counters of the registered caches, exposed in the Prometheus text format.
+# If profile_seconds is set, callbacks are run under cProfile and the profile
+# of every call slower than that is written to profile_dir
+class Metrics:
+    def __init__(self, profile_seconds=None, profile_dir="profiles"):
+        self.profile_seconds = profile_seconds
+        self.profile_dir = profile_dir
+        self.durations = {}
+        self.sizes = {}
+        self.calls = {}
+        self.rows = {}
+        self.caches = {}
+        self._current = threading.local()
+        self._lock = threading.Lock()
+
+    def register_cache(self, name, cache):
+        self.caches[name] = cache
+
+    def add_rows(self, callback, rows):
+        with self._lock:
+            self.rows[callback] = self.rows.get(callback, 0) + int(rows)
+
+    def observe(self, callback, seconds, outcome):
+        with self._lock:
+            if callback not in self.durations:
+                self.durations[callback] = Histogram(DURATION_BUCKETS)
+            self.durations[callback].observe(seconds)
+            key = (callback, outcome)
+            self.calls[key] = self.calls.get(key, 0) + 1
+
+    def observe_size(self, callback, size):
+        with self._lock:
+            if callback not in self.sizes:
+                self.sizes[callback] = Histogram(SIZE_BUCKETS)
+            self.sizes[callback].observe(size)
+
+    # Call function(*args), under cProfile when profiling is enabled. Runs in
+    # the thread doing the work, so callbacks running in the job pool are
+    # profiled there rather than in the request thread waiting for them
+    def profile(self, name, function, *args):
+        if not self.profile_seconds:
+            return function(*args)
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            return profiler.runcall(function, *args)
+        finally:
+            if time.perf_counter() - start >= self.profile_seconds:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                profiler.dump_stats(
+                    os.path.join(self.profile_dir, f"{name}-{time.time():.6f}.prof")
+                )
+
+    # Decorator recording the duration and outcome of a callback or route. The
+    # name is kept for the request, so the size of the response can be
+    # attributed to it. A callback marked background profiles itself where it
+    # runs
+    def timed(self, name):
+        return lambda function: self.wrap(name, function)
+
+    def wrap(self, name, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            self._current.name = name
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                if getattr(function, "background", False):
+                    result = function(*args, **kwargs)
+                else:
+                    result = self.profile(
+                        name, functools.partial(function, *args, **kwargs)
+                    )
+                outcome = "ok"
+                return result
+            except PreventUpdate:
+                outcome = "prevented"
+                raise
+            finally:
+                self.observe(name, time.perf_counter() - start, outcome)
+
+        return wrapper
+
+    # Instrument every callback registered afterwards with app.callback, record
+    # the size of callback and tile responses, and serve /metrics
+    def instrument(self, app):
+        callback = app.callback
+
+        @functools.wraps(callback)
+        def instrumented_callback(*args, **kwargs):
+            decorator = callback(*args, **kwargs)
+            return lambda function: decorator(self.wrap(function.__name__, function))
+
+        app.callback = instrumented_callback
+
+        @app.server.after_request
+        def record_size(response):
+            name = getattr(self._current, "name", None)
+            if name is not None:
+                self._current.name = None
+                if not response.direct_passthrough:
+                    self.observe_size(name, response.calculate_content_length() or 0)
+            return response
+
+        @app.server.route("/metrics")
+        def serve_metrics():
+            return flask.Response(
+                self.render(), content_type="text/plain; version=0.0.4"
+            )
+
+    # Current values in the Prometheus text exposition format
+    def render(self):
+        lines = []
+        with self._lock:
+            lines += [
+                "# HELP landslides_callback_duration_seconds Callback duration.",
+                "# TYPE landslides_callback_duration_seconds histogram",
+            ]
+            for callback, histogram in sorted(self.durations.items()):
+                lines += histogram.lines(
+                    "landslides_callback_duration_seconds", f'callback="{callback}"'
+                )
+            lines += [
+                "# HELP landslides_callback_calls_total Callback calls by outcome.",
+                "# TYPE landslides_callback_calls_total counter",
+            ]
+            for (callback, outcome), count in sorted(self.calls.items()):
+                lines.append(
+                    "landslides_callback_calls_total"
+                    f'{{callback="{callback}",outcome="{outcome}"}} {count}'
+                )
+            lines += [
+                "# HELP landslides_callback_rows_total Catalog rows processed.",
+                "# TYPE landslides_callback_rows_total counter",
+            ]
+            for callback, rows in sorted(self.rows.items()):
+                lines.append(
+                    f'landslides_callback_rows_total{{callback="{callback}"}} {rows}'
+                )
+            lines += [
+                "# HELP landslides_response_bytes Serialized response size.",
+                "# TYPE landslides_response_bytes histogram",
+            ]
+            for callback, histogram in sorted(self.sizes.items()):
+                lines += histogram.lines(
+                    "landslides_response_bytes", f'callback="{callback}"'
+                )
+
+        stats = {name: cache.stats() for name, cache in self.caches.items()}
+        for cache in stats.values():
+            lookups = cache["hits"] + cache["misses"]
+            cache["hit_ratio"] = cache["hits"] / lookups if lookups else 0.0
+        for metric, kind, description in [
+            ("hits", "counter", "Cache hits."),
+            ("misses", "counter", "Cache misses."),
+            ("evictions", "counter", "Cache evictions."),
+            ("invalidations", "counter", "Entries dropped on data reloads."),
+            ("size", "gauge", "Cached entries."),
+            ("hit_ratio", "gauge", "Share of lookups answered by the cache."),
+        ]:
+            name = f"landslides_cache_{metric}"
+            if kind == "counter":
+                name += "_total"
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+            for cache in sorted(stats):
+                lines.append(f'{name}{{cache="{cache}"}} {stats[cache][metric]}')
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,273 @@
+import numpy as np
+
+from catalog import build_offset_index
+
+# Deepest zoom level of the cluster hierarchy, the Leaflet maximum
+MAX_ZOOM = 18
+
+# Width of a cluster cell in screen pixels, a 256 pixel tile holds 4 x 4 cells
+CELL_SIZE = 64
+TILE_CELLS = 256 // CELL_SIZE
+
+# Web Mercator is undefined at the poles
+MAX_LATITUDE = 85.0511
+
+# Size of a spatial index cell in degrees
+GRID_SIZE = 1.0
+
+# Mean Earth radius in kilometres
+EARTH_RADIUS = 6371.0088
+
+
+# Great-circle distance in kilometres
+def haversine(latitude1, longitude1, latitude2, longitude2):
+    latitude1, longitude1, latitude2, longitude2 = (
+        np.radians(latitude1),
+        np.radians(longitude1),
+        np.radians(latitude2),
+        np.radians(longitude2),
+    )
+    a = (
+        np.sin((latitude2 - latitude1) / 2) ** 2
+        + np.cos(latitude1)
+        * np.cos(latitude2)
+        * np.sin((longitude2 - longitude1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+# Normalized Web Mercator coordinates in [0, 1), y grows southwards
+def mercator(latitude, longitude):
+    latitude = np.radians(np.clip(latitude, -MAX_LATITUDE, MAX_LATITUDE))
+    x = (np.asarray(longitude, dtype=np.float64) + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(latitude) + 1.0 / np.cos(latitude)) / np.pi) / 2.0
+    return np.clip(x, 0.0, 1.0 - 1e-12), np.clip(y, 0.0, 1.0 - 1e-12)
+
+
+# One level of the hierarchy: grid cells with their point count, coordinate
+# sums (for the centroid) and the catalog row of single-point cells
+class ClusterLevel:
+    def __init__(self, cell_x, cell_y, count, latitude, longitude, row):
+        self.cell_x = cell_x
+        self.cell_y = cell_y
+        self.count = count
+        self.latitude = latitude
+        self.longitude = longitude
+        self.row = row
+
+    # Merge the cells of this level into the cells of the given grid coordinates
+    def merge(self, cell_x, cell_y):
+        keys, first, inverse = np.unique(
+            (cell_x << 32) | cell_y, return_index=True, return_inverse=True
+        )
+        return ClusterLevel(
+            keys >> 32,
+            keys & 0xFFFFFFFF,
+            np.bincount(inverse, weights=self.count).astype(np.int64),
+            np.bincount(inverse, weights=self.latitude),
+            np.bincount(inverse, weights=self.longitude),
+            self.row[first],
+        )
+
+    # Reorder the cells by map tile, so the cells of a tile are contiguous
+    def sort_by_tile(self):
+        tile_keys = ((self.cell_x // TILE_CELLS) << 32) | (self.cell_y // TILE_CELLS)
+        order = np.argsort(tile_keys, kind="stable")
+        self.tile_keys = tile_keys[order]
+        for name in ["cell_x", "cell_y", "count", "latitude", "longitude", "row"]:
+            setattr(self, name, getattr(self, name)[order])
+
+    def __len__(self):
+        return len(self.count)
+
+
+# Grid-based cluster hierarchy over a set of catalog rows. Level z groups the
+# points falling in the same CELL_SIZE pixel cell at zoom z, and is built by
+# merging the cells of level z + 1 two by two, like a quadtree
+class ClusterIndex:
+    def __init__(self, latitude, longitude, rows):
+        latitude = np.asarray(latitude, dtype=np.float64)[rows]
+        longitude = np.asarray(longitude, dtype=np.float64)[rows]
+        valid = ~(np.isnan(latitude) | np.isnan(longitude))
+        latitude, longitude, rows = latitude[valid], longitude[valid], rows[valid]
+
+        x, y = mercator(latitude, longitude)
+        scale = 256 * 2**MAX_ZOOM / CELL_SIZE
+        points = ClusterLevel(
+            None, None, np.ones(len(rows), dtype=np.int64), latitude, longitude, rows
+        )
+        level = points.merge(
+            np.floor(x * scale).astype(np.int64), np.floor(y * scale).astype(np.int64)
+        )
+        self.levels = [level]
+        for _ in range(MAX_ZOOM):
+            level = level.merge(level.cell_x >> 1, level.cell_y >> 1)
+            self.levels.append(level)
+        self.levels.reverse()
+        for level in self.levels:
+            level.sort_by_tile()
+
+    # Clusters and single points of map tile (z, x, y) as a list of
+    # (latitude, longitude, count, row) tuples, row is only meaningful when
+    # count is 1. There are no tiles deeper than MAX_ZOOM
+    def tile(self, z, x, y):
+        if z > MAX_ZOOM:
+            return []
+        level = self.levels[z]
+        key = (x << 32) | y
+        start, stop = np.searchsorted(level.tile_keys, [key, key + 1])
+        cells = slice(start, stop)
+        count = level.count[cells]
+        return list(
+            zip(
+                level.latitude[cells] / count,
+                level.longitude[cells] / count,
+                count,
+                level.row[cells],
+            )
+        )
+
+    # Point count of the level z cells holding the given points, 0 for points
+    # that are not in the hierarchy
+    def counts(self, z, latitude, longitude):
+        level = self.levels[z]
+        x, y = mercator(latitude, longitude)
+        scale = 256 * 2**MAX_ZOOM / CELL_SIZE
+        shift = MAX_ZOOM - z
+        cell_x = np.floor(x * scale).astype(np.int64) >> shift
+        cell_y = np.floor(y * scale).astype(np.int64) >> shift
+        keys = (cell_x << 32) | cell_y
+        counts = np.zeros(len(keys), dtype=np.int64)
+        # Cells of a tile are contiguous and sorted by (x, y)
+        for key in np.unique(keys):
+            tile = ((key >> 32) // TILE_CELLS << 32) | (key & 0xFFFFFFFF) // TILE_CELLS
+            start, stop = np.searchsorted(level.tile_keys, [tile, tile + 1])
+            cells = (level.cell_x[start:stop] << 32) | level.cell_y[start:stop]
+            i = np.searchsorted(cells, key)
+            if i < len(cells) and cells[i] == key:
+                counts[keys == key] = level.count[start + i]
+        return counts
+
+
+# Map tiles (z, x, y) covering the bounds [[south, west], [north, east]].
+# Zooms past MAX_ZOOM use MAX_ZOOM tiles, and coarser zoom levels are used
+# while more than limit tiles would be needed
+def visible_tiles(bounds, zoom, limit):
+    (south, west), (north, east) = bounds
+    left, top = mercator(north, west)
+    right, bottom = mercator(south, east)
+    zoom = int(min(max(zoom or 0, 0), MAX_ZOOM))
+    while True:
+        n = 2**zoom
+        xs = range(int(left * n), int(right * n) + 1)
+        ys = range(int(top * n), int(bottom * n) + 1)
+        if zoom == 0 or len(xs) * len(ys) <= limit:
+            return [(zoom, x, y) for x in xs for y in ys]
+        zoom -= 1
+
+
+# Fixed grid over the catalog coordinates, built once at load. Rows of a cell
+# are a contiguous slice of a sorted offset index, so bounding-box, radius and
+# nearest queries only look at the cells they overlap. Every query takes an
+# optional filter key (see catalog.filter_key) to combine it with the
+# category/trigger/year/size filters
+class SpatialIndex:
+    def __init__(self, catalog, cell_size=GRID_SIZE):
+        self.catalog = catalog
+        self.cell_size = cell_size
+        self.latitude = catalog.df["latitude"].to_numpy(np.float64)
+        self.longitude = catalog.df["longitude"].to_numpy(np.float64)
+        self.n_rows = int(np.ceil(180 / cell_size))
+        self.n_columns = int(np.ceil(360 / cell_size))
+
+        # Rows without coordinates go to an extra cell that is never queried
+        size = self.n_rows * self.n_columns
+        valid = ~(np.isnan(self.latitude) | np.isnan(self.longitude))
+        keys = np.full(len(self.latitude), size, dtype=np.int64)
+        keys[valid] = self.cell_row(self.latitude[valid]) * self.n_columns + (
+            self.cell_column(self.longitude[valid])
+        )
+        self.order, self.offsets = build_offset_index(keys, size + 1)
+
+    def cell_row(self, latitude):
+        row = np.floor((np.asarray(latitude) + 90) / self.cell_size).astype(np.int64)
+        return np.clip(row, 0, self.n_rows - 1)
+
+    def cell_column(self, longitude):
+        column = np.floor((np.asarray(longitude) + 180) / self.cell_size)
+        return np.clip(column.astype(np.int64), 0, self.n_columns - 1)
+
+    # Rows of the cells overlapping a bounding box, west > east crosses the
+    # antimeridian
+    def candidates(self, south, west, north, east):
+        first_row, last_row = int(self.cell_row(south)), int(self.cell_row(north))
+        first, last = int(self.cell_column(west)), int(self.cell_column(east))
+        if west <= east:
+            spans = [(first, last)]
+        else:
+            spans = [(first, self.n_columns - 1), (0, last)]
+        slices = [
+            self.order[
+                self.offsets[row * self.n_columns + start] : self.offsets[
+                    row * self.n_columns + stop + 1
+                ]
+            ]
+            for row in range(first_row, last_row + 1)
+            for start, stop in spans
+        ]
+        if not slices:
+            return self.order[:0]
+        return np.concatenate(slices)
+
+    # Rows inside the bounds [[south, west], [north, east]]
+    def bbox(self, bounds, key=None):
+        (south, west), (north, east) = bounds
+        rows = self.candidates(south, west, north, east)
+        latitude, longitude = self.latitude[rows], self.longitude[rows]
+        mask = (latitude >= south) & (latitude <= north)
+        if west <= east:
+            mask &= (longitude >= west) & (longitude <= east)
+        else:
+            mask &= (longitude >= west) | (longitude <= east)
+        rows = rows[mask]
+        if key is not None:
+            rows = rows[self.catalog.matches(rows, *key)]
+        return rows
+
+    # Rows within km kilometres of a point, sorted by distance. Returns the rows
+    # and their distances
+    def radius(self, latitude, longitude, km, key=None):
+        angle = km / EARTH_RADIUS
+        delta = np.degrees(angle)
+        if abs(latitude) + delta >= 90 or angle >= np.pi / 2:
+            south, north = max(latitude - delta, -90), min(latitude + delta, 90)
+            west, east = -180, 180
+        else:
+            south, north = latitude - delta, latitude + delta
+            spread = np.degrees(
+                np.arcsin(min(np.sin(angle) / np.cos(np.radians(latitude)), 1.0))
+            )
+            west, east = longitude - spread, longitude + spread
+            if west < -180:
+                west += 360
+            if east > 180:
+                east -= 360
+        rows = self.bbox([[south, west], [north, east]], key)
+        distances = haversine(
+            latitude, longitude, self.latitude[rows], self.longitude[rows]
+        )
+        inside = distances <= km
+        rows, distances = rows[inside], distances[inside]
+        order = np.argsort(distances, kind="stable")
+        return rows[order], distances[order]
+
+    # The n rows closest to a point, searching in growing circles. Returns the
+    # rows and their distances
+    def nearest(self, latitude, longitude, n=1, key=None, max_km=None):
+        max_km = max_km or np.pi * EARTH_RADIUS
+        km = min(self.cell_size * 111.0, max_km)
+        while True:
+            rows, distances = self.radius(latitude, longitude, km, key)
+            if len(rows) >= n or km >= max_km:
+                return rows[:n], distances[:n]
+            km = min(km * 4, max_km)
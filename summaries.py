@@ -0,0 +1,147 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import wikipedia
+
+from ingest import cache_lock, load_catalog
+
+# Summaries older than this are fetched again, in seconds
+TTL = 30 * 24 * 3600
+
+# Failed fetches are not retried before this delay, in seconds
+RETRY_DELAY = 300
+
+# Socket timeout of every request to the Wikipedia API, in seconds. A fetch
+# that times out counts as failed
+REQUEST_TIMEOUT = 10.0
+
+# wikipedia calls requests.get without a timeout, so a stalled connection
+# would hold an executor thread forever. Its requests get one here
+wikipedia.wikipedia.requests = types.SimpleNamespace(
+    get=functools.partial(requests.get, timeout=REQUEST_TIMEOUT)
+)
+
+
+# Wikipedia summaries persisted in a JSON file, keyed by title. Lookups never
+# wait on the network: a missing or expired entry is fetched in a background
+# thread and the cached (even expired) text or a static fallback is returned
+# at once. Only warm waits for the fetches
+class SummaryCache:
+    def __init__(self, path, ttl=TTL, retry_delay=RETRY_DELAY):
+        self.path = path
+        self.ttl = ttl
+        self.retry_delay = retry_delay
+        self._entries = self.read()
+        self._failures = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="wikipedia"
+        )
+
+    def read(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    # Merge the entries with the ones on disk, which other processes (e.g.
+    # gunicorn workers) may have written, keeping the latest fetch of every
+    # title. The file is locked meanwhile, and written to a temporary file of
+    # this process first so readers never see a partial file
+    def write(self):
+        with cache_lock(self.path):
+            for title, entry in self.read().items():
+                current = self._entries.get(title)
+                if current is None or current["fetched"] < entry["fetched"]:
+                    self._entries[title] = entry
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+
+    def fresh(self, title):
+        entry = self._entries.get(title)
+        return entry is not None and time.time() - entry["fetched"] < self.ttl
+
+    # Fetch a summary and store it, runs in the executor
+    def fetch(self, title):
+        try:
+            summary = wikipedia.summary(title)
+        except Exception:
+            with self._lock:
+                self._failures[title] = time.time()
+                del self._pending[title]
+            raise
+        with self._lock:
+            self._entries[title] = {"summary": summary, "fetched": time.time()}
+            self._failures.pop(title, None)
+            del self._pending[title]
+            self.write()
+        return summary
+
+    # Start a background fetch of a title, unless one is running or the last
+    # one failed recently. Returns the future, None if no fetch is running
+    def refresh(self, title):
+        with self._lock:
+            if title in self._pending:
+                return self._pending[title]
+            if time.time() - self._failures.get(title, 0) < self.retry_delay:
+                return None
+            future = self._executor.submit(self.fetch, title)
+            self._pending[title] = future
+            return future
+
+    # Summary of a title, fallback if it is not cached. A missing or expired
+    # entry is fetched in the background for the next lookups
+    def get(self, title, fallback=None):
+        if not self.fresh(title):
+            self.refresh(title)
+        entry = self._entries.get(title)
+        if entry is None:
+            return fallback
+        return entry["summary"]
+
+    # Fetch every title that is missing or expired, waiting for the results.
+    # Returns the titles that could not be fetched
+    def warm(self, titles, force=False):
+        futures = {
+            title: self.refresh(title)
+            for title in titles
+            if force or not self.fresh(title)
+        }
+        failed = []
+        for title, future in futures.items():
+            try:
+                if future is None:
+                    raise RuntimeError("fetch failed recently")
+                future.result()
+            except Exception:
+                failed.append(title)
+        return failed
+
+
+# Pre-warm the summary cache before deploying to a host without network access
+# python3 summaries.py [--force] [title ...]
+# Without titles, every landslide category of the catalog is fetched
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    force = "--force" in args
+    titles = [arg for arg in args if arg != "--force"]
+    if not titles:
+        catalog = load_catalog("./data/Global_Landslide_Catalog_Export.csv")
+        titles = list(catalog.categories["landslide_category"])
+    cache = SummaryCache("./data/.cache/wikipedia.json")
+    failed = cache.warm(titles, force)
+    for title in titles:
+        status = "failed" if title in failed else "ok"
+        print(f"{title}: {status}")
+    sys.exit(1 if failed else 0)
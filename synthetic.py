@@ -0,0 +1,184 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from catalog import COLUMNS
+
+# Value frequencies, roughly those of the NASA Global Landslide Catalog
+CATEGORY_WEIGHTS = {
+    "landslide": 0.62,
+    "mudslide": 0.16,
+    "rock_fall": 0.10,
+    "complex": 0.03,
+    "debris_flow": 0.03,
+    "other": 0.01,
+    "unknown": 0.01,
+    "riverbank_collapse": 0.006,
+    "translational_slide": 0.006,
+    "lahar": 0.004,
+    "snow_avalanche": 0.004,
+    "creep": 0.003,
+    "topple": 0.003,
+}
+TRIGGER_WEIGHTS = {
+    "downpour": 0.40,
+    "rain": 0.22,
+    "unknown": 0.15,
+    "tropical_cyclone": 0.05,
+    "continuous_rain": 0.04,
+    "monsoon": 0.03,
+    "snowfall_snowmelt": 0.015,
+    "earthquake": 0.015,
+    "construction": 0.012,
+    "flooding": 0.012,
+    "other": 0.01,
+    "mining": 0.008,
+    "freeze_thaw": 0.006,
+    "no_apparent_trigger": 0.006,
+    "leaking_pipe": 0.004,
+    "dam_embankment_collapse": 0.002,
+    "volcano": 0.001,
+    None: 0.01,
+}
+SIZE_WEIGHTS = {
+    "medium": 0.60,
+    "small": 0.24,
+    "large": 0.08,
+    "unknown": 0.04,
+    "very_large": 0.02,
+    "catastrophic": 0.002,
+    None: 0.018,
+}
+
+# Landslide hotspots as (country, latitude, longitude, spread in degrees,
+# weight). Events are drawn around the hotspots, a country of None leaves
+# the country empty as in the export, for events away from any border
+HOTSPOTS = [
+    ("United States", 39.0, -121.0, 4.0, 0.10),
+    ("United States", 37.0, -81.0, 3.0, 0.06),
+    ("India", 30.0, 78.0, 3.0, 0.06),
+    ("India", 10.5, 76.5, 1.5, 0.03),
+    ("Nepal", 28.0, 84.0, 1.5, 0.06),
+    ("China", 29.0, 104.0, 4.0, 0.07),
+    ("Philippines", 13.0, 122.0, 3.0, 0.06),
+    ("Indonesia", -7.0, 110.0, 3.0, 0.06),
+    ("Brazil", -22.5, -43.5, 2.0, 0.04),
+    ("Colombia", 5.0, -75.5, 2.0, 0.04),
+    ("Malaysia", 4.0, 102.0, 2.0, 0.03),
+    ("Japan", 35.5, 137.0, 3.0, 0.03),
+    ("Canada", 50.0, -122.0, 3.0, 0.03),
+    ("Mexico", 19.0, -98.0, 3.0, 0.03),
+    ("Peru", -10.0, -76.0, 3.0, 0.02),
+    ("Guatemala", 15.0, -91.0, 1.0, 0.02),
+    ("Pakistan", 34.5, 73.0, 1.5, 0.02),
+    ("Sri Lanka", 7.0, 80.5, 0.8, 0.02),
+    ("Vietnam", 21.0, 104.5, 1.5, 0.02),
+    ("Taiwan", 23.8, 121.0, 0.7, 0.02),
+    ("Italy", 44.5, 10.0, 2.5, 0.02),
+    ("United Kingdom", 54.0, -2.5, 2.0, 0.02),
+    (None, 0.0, 0.0, 60.0, 0.12),
+]
+
+# Events per year grow with the coverage of the news sources, and peak with
+# the northern hemisphere monsoon
+FIRST_YEAR, LAST_YEAR = 1988, 2017
+MONTH_WEIGHTS = [5, 5, 6, 6, 7, 10, 14, 14, 11, 8, 7, 7]
+
+SOURCES = ["Reuters", "AP", "BBC", "Xinhua", "The Hindu", "Inquirer", "CBC"]
+
+
+# Draw n values from a {value: weight} dictionary
+def choice(rng, weights, n):
+    values = np.array(list(weights), dtype=object)
+    p = np.array(list(weights.values()), dtype=np.float64)
+    return values[rng.choice(len(values), n, p=p / p.sum())]
+
+
+# Zero-inflated, heavy-tailed casualty counts with a share of missing values
+def casualties(rng, n, zero, missing):
+    counts = np.floor(rng.lognormal(0.5, 1.2, n)).astype(np.float64)
+    counts[rng.random(n) < zero] = 0
+    counts[rng.random(n) < missing] = np.nan
+    return counts
+
+
+# Event timestamps spread over the years and months of the catalog
+def event_dates(rng, n):
+    years = np.arange(FIRST_YEAR, LAST_YEAR + 1)
+    # Few events before 2007, when the catalog started being compiled
+    year_weights = np.where(years < 2007, 0.05, 1.0) * np.linspace(1, 2, len(years))
+    year = years[rng.choice(len(years), n, p=year_weights / year_weights.sum())]
+    month = 1 + rng.choice(12, n, p=np.array(MONTH_WEIGHTS) / sum(MONTH_WEIGHTS))
+    dates = pd.to_datetime({"year": year, "month": month, "day": 1})
+    offsets = rng.random(n) * dates.dt.days_in_month.to_numpy() * 86400
+    return dates + pd.to_timedelta(np.floor(offsets), unit="s")
+
+
+# One chunk of n events with ids starting at first_id
+def catalog_chunk(rng, first_id, n):
+    ids = np.arange(first_id, first_id + n)
+    id_text = pd.Series(ids).astype(str)
+
+    weights = np.array([h[4] for h in HOTSPOTS])
+    hotspot = rng.choice(len(HOTSPOTS), n, p=weights / weights.sum())
+    centers = np.array([h[1:4] for h in HOTSPOTS])[hotspot]
+    latitude = np.clip(rng.normal(centers[:, 0], centers[:, 2] / 2), -60, 75)
+    longitude = (rng.normal(centers[:, 1], centers[:, 2]) + 180) % 360 - 180
+    country = np.array([h[0] for h in HOTSPOTS], dtype=object)[hotspot]
+
+    category = choice(rng, CATEGORY_WEIGHTS, n)
+    place = pd.Series(country).fillna("Remote area")
+    df = pd.DataFrame(
+        {
+            "source_name": np.array(SOURCES, dtype=object)[
+                rng.integers(0, len(SOURCES), n)
+            ],
+            "source_link": "https://example.org/news/" + id_text,
+            "event_id": ids,
+            "event_date": event_dates(rng, n).dt.strftime("%m/%d/%Y %I:%M:%S %p"),
+            "event_description": "Synthetic "
+            + pd.Series(category).str.replace("_", " ")
+            + " reported in "
+            + place
+            + ".",
+            "event_title": place + " " + pd.Series(category).str.replace("_", " "),
+            "landslide_category": category,
+            "landslide_trigger": choice(rng, TRIGGER_WEIGHTS, n),
+            "landslide_size": choice(rng, SIZE_WEIGHTS, n),
+            "fatality_count": casualties(rng, n, zero=0.8, missing=0.12),
+            "injury_count": casualties(rng, n, zero=0.85, missing=0.45),
+            "photo_link": np.where(
+                rng.random(n) < 0.15, "https://example.org/photos/" + id_text, None
+            ),
+            "latitude": latitude.round(5),
+            "longitude": longitude.round(5),
+            "country_name": country,
+        }
+    )
+    return df[COLUMNS]
+
+
+# Stream a synthetic catalog in chunks of chunksize events, so catalogs of
+# tens of millions of rows never have to fit in memory
+def catalog_chunks(rows, seed=0, chunksize=500_000):
+    for index, start in enumerate(range(0, rows, chunksize)):
+        rng = np.random.default_rng([seed, index])
+        yield catalog_chunk(rng, start + 1, min(chunksize, rows - start))
+
+
+# Write a synthetic catalog with the columns and formats of the NASA export
+def write_catalog(path, rows, seed=0, chunksize=500_000):
+    for index, chunk in enumerate(catalog_chunks(rows, seed, chunksize)):
+        chunk.to_csv(path, mode="a" if index else "w", header=not index, index=False)
+
+
+# python3 synthetic.py data/Global_Landslide_Catalog_Export.csv --rows 1000000
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic catalog")
+    parser.add_argument("path", help="CSV file to write")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunksize", type=int, default=500_000)
+    args = parser.parse_args()
+    write_catalog(args.path, args.rows, args.seed, args.chunksize)
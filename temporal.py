@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+
+# Bucket granularities of the precomputed histograms, as pandas frequencies.
+# Weeks start on Monday
+FREQUENCIES = {"month": "MS", "week": "W-MON"}
+
+# Meteorological seasons of the months of the year, December to February first
+SEASONS = ["Winter", "Spring", "Summer", "Autumn"]
+MONTH_SEASONS = np.array([0, 0, 1, 1, 1, 2, 2, 2, 3, 3, 3, 0])
+
+
+# Sorted timestamp index. Events are grouped by (category, trigger, size)
+# combination and sorted by time within each group, with prefix sums of the
+# fatality and injury counts in the same order. The events of a group in any
+# date range are then found with two binary searches, and their count and sums
+# are differences of the prefix sums. The positions of the month and week
+# boundaries in every group are precomputed, so histograms over these buckets
+# need no search at all
+class TemporalIndex:
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.shape = tuple(
+            len(catalog.categories[d]) + 1
+            for d in ["landslide_category", "landslide_trigger", "landslide_size"]
+        )
+        dates = catalog.df["event_date"]
+        dated = np.flatnonzero(dates.notna().to_numpy())
+        self.start = pd.Timestamp(catalog.min_year, 1, 1)
+        self.end = pd.Timestamp(catalog.max_year + 1, 1, 1)
+        seconds = (
+            dates.to_numpy()[dated] - self.start.to_datetime64()
+        ) // np.timedelta64(1, "s")
+        combos = np.ravel_multi_index(
+            tuple(
+                catalog.codes[d][dated].astype(np.int64) + 1
+                for d in ["landslide_category", "landslide_trigger", "landslide_size"]
+            ),
+            self.shape,
+        )
+        order = np.lexsort((seconds, combos))
+
+        # Combinations that occur, events of combination i are at
+        # offsets[i]:offsets[i + 1] of the sorted arrays
+        self.combos, offsets = np.unique(combos[order], return_index=True)
+        self.offsets = np.append(offsets, len(order))
+        # Sort keys, the group index times the span of the catalog plus the
+        # seconds since its start, so that one searchsorted call finds a date
+        # in every group at once
+        self.span = int((self.end - self.start) // pd.Timedelta(seconds=1)) + 1
+        groups = np.repeat(np.arange(len(self.combos)), np.diff(self.offsets))
+        self.keys = groups * self.span + seconds[order]
+        self.fatalities = np.concatenate(
+            [[0], np.cumsum(catalog.df["fatality_count"].to_numpy()[dated][order])]
+        )
+        self.injuries = np.concatenate(
+            [[0], np.cumsum(catalog.df["injury_count"].to_numpy()[dated][order])]
+        )
+
+        # Bucket boundaries and their positions in every group
+        self.bounds = {}
+        self.positions = {}
+        for bucket, frequency in FREQUENCIES.items():
+            bounds = pd.date_range(
+                self.start - pd.Timedelta(days=6), self.end, freq=frequency
+            )
+            bounds = bounds[bounds.searchsorted(self.start, side="right") - 1 :]
+            if bounds[-1] < self.end:
+                bounds = bounds.append(pd.DatetimeIndex([self.end]))
+            self.bounds[bucket] = bounds
+            self.positions[bucket] = self.search(
+                np.arange(len(self.combos)), bounds
+            ).reshape(len(self.combos), len(bounds))
+
+    # Positions in the sorted arrays of the given dates in the given groups,
+    # one row per group
+    def search(self, groups, dates):
+        seconds = (pd.DatetimeIndex(dates) - self.start) // pd.Timedelta(seconds=1)
+        seconds = np.clip(np.asarray(seconds, dtype=np.int64), 0, self.span - 1)
+        return np.searchsorted(
+            self.keys, (groups[:, None] * self.span + seconds[None, :]).ravel()
+        )
+
+    # Groups matching a filter, with the semantics of LandslideCatalog.select
+    def groups(self, category, triggers=None, sizes=None):
+        category_code = self.catalog.code("landslide_category", category)
+        if category_code is None:
+            return np.empty(0, dtype=np.int64)
+        categories, trigger_codes, size_codes = np.unravel_index(
+            self.combos, self.shape
+        )
+        mask = categories == category_code + 1
+        if triggers:
+            table = self.catalog.lookup_table("landslide_trigger", triggers)
+            mask &= table[trigger_codes]
+        else:
+            mask &= trigger_codes > 0
+        if sizes:
+            mask &= self.catalog.lookup_table("landslide_size", sizes)[size_codes]
+        return np.flatnonzero(mask)
+
+    # Count, fatality sum and injury sum of the events matching a filter in
+    # [start, end), any timestamps
+    def totals(self, category, start, end, triggers=None, sizes=None):
+        groups = self.groups(category, triggers, sizes)
+        if pd.Timestamp(start) >= pd.Timestamp(end):
+            groups = groups[:0]
+        first, last = self.search(groups, [start, end]).reshape(len(groups), 2).T
+        return (
+            int((last - first).sum()),
+            float((self.fatalities[last] - self.fatalities[first]).sum()),
+            float((self.injuries[last] - self.injuries[first]).sum()),
+        )
+
+    # Month or week histogram of the events matching a filter in [start, end):
+    # the start of every bucket with its event count, fatality and injury sums.
+    # Buckets cut by the range only count the events inside it
+    def histogram(self, bucket, category, start, end, triggers=None, sizes=None):
+        groups = self.groups(category, triggers, sizes)
+        bounds = self.bounds[bucket]
+        start = max(pd.Timestamp(start), self.start)
+        end = min(pd.Timestamp(end), self.end)
+        if start >= end:
+            return bounds[:0], np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+        first = bounds.searchsorted(start, side="right")
+        last = bounds.searchsorted(end, side="left")
+        edges = self.search(groups, [start, end]).reshape(len(groups), 2)
+        positions = np.hstack(
+            [edges[:, :1], self.positions[bucket][groups, first:last], edges[:, 1:]]
+        )
+        return (
+            bounds[first - 1 : last],
+            np.diff(positions, axis=1).sum(axis=0),
+            np.diff(self.fatalities[positions], axis=1).sum(axis=0),
+            np.diff(self.injuries[positions], axis=1).sum(axis=0),
+        )
+
+    # Histogram of the events matching a filter in [start, end) by month of
+    # the year (12 buckets) or by season (4 buckets, see SEASONS), summed over
+    # the years of the range
+    def seasonal(self, bucket, category, start, end, triggers=None, sizes=None):
+        labels, counts, fatalities, injuries = self.histogram(
+            "month", category, start, end, triggers, sizes
+        )
+        months = labels.month.to_numpy() - 1
+        if bucket == "season":
+            months = MONTH_SEASONS[months]
+        n = 4 if bucket == "season" else 12
+        return (
+            np.bincount(months, weights=counts, minlength=n).astype(np.int64),
+            np.bincount(months, weights=fatalities, minlength=n),
+            np.bincount(months, weights=injuries, minlength=n),
+        )
@@ -0,0 +1,220 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import cube as cube_module
+from cache import LRUCache
+from catalog import CATEGORICAL_COLUMNS, LandslideCatalog, filter_key, stale_entries
+from cube import DataCube
+from ingest import DATE_FORMAT, load_catalog
+from synthetic import catalog_chunk, write_catalog
+
+FIELDS = ["year_counts", "injuries", "fatalities", "trigger_counts", "country_counts"]
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    df = catalog_chunk(np.random.default_rng(0), 1, 5000)
+    df["event_date"] = pd.to_datetime(df["event_date"], format=DATE_FORMAT)
+    return LandslideCatalog(df)
+
+
+@pytest.fixture(scope="module")
+def cube(catalog):
+    return DataCube(catalog)
+
+
+# Random filter key, unknown categories and years outside the catalog included
+def random_key(catalog, rng):
+    categories = list(catalog.categories["landslide_category"]) + ["unknown_kind"]
+    category = categories[rng.integers(len(categories))]
+    triggers = list(catalog.categories["landslide_trigger"])
+    sizes = rng.choice(
+        list(catalog.categories["landslide_size"]), rng.integers(0, 3), False
+    )
+    start = int(rng.integers(catalog.min_year - 2, catalog.max_year + 2))
+    end = int(rng.integers(start, catalog.max_year + 3))
+    return filter_key(
+        category,
+        [start, end],
+        list(rng.choice(triggers, rng.integers(0, 4), False)),
+        list(sizes),
+    )
+
+
+# Neighbouring key of the same category and sizes, as the next filter of a
+# session: a year bound moved by one or a trigger added or removed
+def neighbour(catalog, rng, key):
+    category, start, end, triggers, sizes = key
+    change = rng.integers(4)
+    if change == 0:
+        start += int(rng.choice([-1, 1]))
+    elif change == 1:
+        end += int(rng.choice([-1, 1]))
+    elif change == 2 and triggers:
+        triggers = triggers[1:]
+    else:
+        triggers = triggers + (
+            catalog.categories["landslide_trigger"][rng.integers(3)],
+        )
+    return filter_key(category, [start, end], list(triggers), list(sizes))
+
+
+# Pairs of keys, mostly neighbours so that the delta paths are taken,
+# sometimes unrelated
+def key_pairs(catalog, n=300, seed=1):
+    rng = np.random.default_rng(seed)
+    for _ in range(n):
+        previous = random_key(catalog, rng)
+        if rng.random() < 0.8:
+            yield previous, neighbour(catalog, rng, previous)
+        else:
+            yield previous, random_key(catalog, rng)
+
+
+def assert_aggregates_equal(actual, expected):
+    for field in FIELDS:
+        np.testing.assert_allclose(getattr(actual, field), getattr(expected, field))
+
+
+def test_update_matches_select(catalog):
+    for previous, key in key_pairs(catalog):
+        rows = catalog.update(previous, catalog.select(*previous), key)
+        np.testing.assert_array_equal(rows, catalog.select(*key))
+
+
+def test_cube_update_matches_aggregate(cube, catalog):
+    for previous, key in key_pairs(catalog):
+        aggregates = cube.update(previous, cube.aggregate(*previous), key)
+        assert_aggregates_equal(aggregates, cube.aggregate(*key))
+
+
+def test_cube_matches_catalog_aggregate(cube, catalog):
+    rng = np.random.default_rng(2)
+    for _ in range(300):
+        key = random_key(catalog, rng)
+        assert_aggregates_equal(
+            cube.aggregate(*key), catalog.aggregate(catalog.select(*key))
+        )
+
+
+def test_cube_built_in_blocks(cube, catalog, monkeypatch):
+    monkeypatch.setattr(cube_module, "BLOCK_SIZE", 997)
+    blocks = DataCube(catalog)
+    for field in ["counts", "fatalities", "injuries", "country_counts"]:
+        np.testing.assert_array_equal(getattr(blocks, field), getattr(cube, field))
+    np.testing.assert_array_equal(blocks.country_cells, cube.country_cells)
+    np.testing.assert_array_equal(blocks.countries, cube.countries)
+
+
+# Events are found by id, the first row wins on duplicate ids
+def test_event_lookup():
+    df = catalog_chunk(np.random.default_rng(3), 1, 500)
+    df["event_date"] = pd.to_datetime(df["event_date"], format=DATE_FORMAT)
+    df["event_id"] = np.random.default_rng(4).integers(0, 200, len(df))
+    duplicates = LandslideCatalog(df)
+    for event_id in range(-1, 201):
+        rows = np.flatnonzero(df["event_id"].to_numpy() == event_id)
+        row = duplicates.event(event_id)
+        if len(rows) == 0:
+            assert row is None
+        else:
+            assert row["event_title"] == df["event_title"].iat[rows[0]]
+
+
+def assert_catalogs_equal(actual, expected):
+    assert len(actual) == len(expected)
+    for column in expected.df.columns:
+        if column in CATEGORICAL_COLUMNS:
+            assert list(actual.categories[column]) == list(expected.categories[column])
+            np.testing.assert_array_equal(actual.codes[column], expected.codes[column])
+        else:
+            np.testing.assert_array_equal(
+                actual.df[column].to_numpy(), expected.df[column].to_numpy()
+            )
+    for column, text in expected.text.items():
+        for name in ["offsets", "data", "missing"]:
+            np.testing.assert_array_equal(
+                getattr(actual.text[column], name), getattr(text, name)
+            )
+
+
+# Catalog of a CSV after a change, reloaded from the cache of the previous
+# version as the dashboard does, and the cache entries the reload keeps
+def reload(path, cache_dir, change, tmp_path):
+    previous = load_catalog(path, cache_dir)
+    cache = LRUCache(maxsize=10_000)
+    rng = np.random.default_rng(5)
+    for _ in range(300):
+        key = random_key(previous, rng)
+        cache.put(key, previous.select(*key))
+    change(path)
+    catalog = load_catalog(path, cache_dir)
+    assert_catalogs_equal(catalog, load_catalog(path, str(tmp_path / "fresh")))
+    stale_key, stale_event = stale_entries(previous, catalog)
+    kept = cache.copy(lambda key, value: stale_key(key))
+    return previous, catalog, cache, kept, stale_event
+
+
+# Rows appended to the CSV are ingested on their own. Only the filters
+# matching one of them are stale, the cached rows of the others are still
+# the rows of the new catalog
+def test_append_reload(tmp_path):
+    path = str(tmp_path / "catalog.csv")
+    write_catalog(path, 5000)
+
+    def append(path):
+        rows = catalog_chunk(np.random.default_rng(6), 10_001, 20)
+        rows.to_csv(path, mode="a", header=False, index=False)
+
+    previous, catalog, cache, kept, stale_event = reload(
+        path, str(tmp_path / "cache"), append, tmp_path
+    )
+    assert catalog.appended_to(previous) == len(previous)
+    assert 0 < len(kept) < len(cache)
+    assert kept.invalidations == len(cache) - len(kept)
+    for key, rows in cache._data.items():
+        changed = not np.array_equal(catalog.select(*key), rows)
+        assert (key not in kept) == changed
+    new_ids = catalog.df["event_id"].to_numpy()[len(previous) :]
+    assert all(stale_event(event_id) for event_id in new_ids)
+    assert not stale_event(int(previous.df["event_id"].iat[0]))
+
+
+# Appended rows with a new category are ingested on their own too, with the
+# codes of the cached rows remapped, but every cached result is stale
+def test_append_new_category_reload(tmp_path):
+    path = str(tmp_path / "catalog.csv")
+    write_catalog(path, 5000)
+
+    def append(path):
+        rows = catalog_chunk(np.random.default_rng(6), 10_001, 20)
+        rows["landslide_trigger"] = "aaa_new_trigger"
+        rows.to_csv(path, mode="a", header=False, index=False)
+
+    previous, catalog, cache, kept, stale_event = reload(
+        path, str(tmp_path / "cache"), append, tmp_path
+    )
+    assert catalog.origin["base"] is not None
+    assert catalog.appended_to(previous) is None
+    assert len(kept) == 0
+
+
+# Any other change rebuilds the cache, and every cached result is stale
+def test_edit_reload(tmp_path):
+    path = str(tmp_path / "catalog.csv")
+    write_catalog(path, 5000)
+
+    def edit(path):
+        with open(path) as f:
+            lines = f.readlines()
+        lines[100] = lines[100].replace(",", ", ", 1)
+        with open(path, "w") as f:
+            f.writelines(lines)
+
+    previous, catalog, cache, kept, stale_event = reload(
+        path, str(tmp_path / "cache"), edit, tmp_path
+    )
+    assert catalog.origin["base"] is None
+    assert len(kept) == 0
+    assert stale_event(int(previous.df["event_id"].iat[0]))
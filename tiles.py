@@ -0,0 +1,59 @@
+import base64
+import gzip
+import hashlib
+import json
+
+from catalog import filter_key
+
+
+# URL-safe token of a normalized filter key, decoded by any worker without
+# shared state so tile URLs can be cached by a CDN or reverse proxy
+def tile_token(key):
+    data = json.dumps(list(key), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+# Filter key of a tile token, raises ValueError if the token is malformed
+def tile_key(token):
+    try:
+        data = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        category, start_year, end_year, triggers, sizes = json.loads(data)
+        return filter_key(category, [start_year, end_year], triggers, sizes)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid tile token '{token}'") from e
+
+
+# GeoJSON feature collection of the clusters and points of a tile
+def tile_features(catalog, clusters, z, x, y):
+    features = []
+    for latitude, longitude, count, row in clusters.tile(z, x, y):
+        if count == 1:
+            properties = {
+                "count": 1,
+                "event_id": int(catalog.df["event_id"].iat[row]),
+                "tooltip": catalog.text["event_title"][row],
+            }
+        else:
+            properties = {"count": int(count), "tooltip": f"{count} landslides"}
+        features.append(
+            {
+                "type": "Feature",
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": [
+                        round(float(longitude), 6),
+                        round(float(latitude), 6),
+                    ],
+                },
+                "properties": properties,
+            }
+        )
+    return {"type": "FeatureCollection", "features": features}
+
+
+# Pre-encoded tile: strong ETag and gzip-compressed GeoJSON body
+def encode_tile(catalog, clusters, z, x, y):
+    body = json.dumps(
+        tile_features(catalog, clusters, z, x, y), separators=(",", ":")
+    ).encode("utf-8")
+    return hashlib.sha1(body).hexdigest(), gzip.compress(body, mtime=0)
@@ -0,0 +1,51 @@
+import os
+import threading
+import time
+import traceback
+
+
+# Polls a file every interval seconds in a background thread and calls
+# on_change once its size and modification time changed and then stayed the
+# same for a whole interval, so a file still being written is not picked up.
+# Changes are detected from the state of the file when the watcher was created,
+# i.e. when the data was loaded. The thread is started once per process, it is
+# not inherited by forked processes
+class FileWatcher:
+    def __init__(self, path, interval, on_change):
+        self.path = path
+        self.interval = interval
+        self.on_change = on_change
+        self._state = self.stat()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime
+
+    # Start watching, once per process
+    def start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(
+            target=self.watch, args=(self._state,), name="watcher", daemon=True
+        ).start()
+
+    def watch(self, current):
+        previous = current
+        while True:
+            time.sleep(self.interval)
+            state = self.stat()
+            if state is not None and state != current and state == previous:
+                try:
+                    self.on_change()
+                    current = state
+                except Exception:
+                    # The previous data keeps being served, retried next time
+                    traceback.print_exc()
+            previous = state